@@ -0,0 +1,242 @@
+# admission.py
+# Admission control for the expensive routes, so a burst on one of them cannot take every thread
+# of the pool and slow down all the others. Routes are grouped into classes:
+#
+#   inference    createComment, bulkImport, scoreAndUpdate    (sentiment model)
+#   auth         register, login                              (bcrypt)
+#   heavy_query  placesWithComments and its variants          (large queries)
+#
+# Each class runs at most CONCURRENCY requests at a time. Up to QUEUE more wait in FIFO order for
+# at most QUEUE_TIMEOUT seconds. Beyond that, requests are refused at once with 503 and
+# Retry-After. Each client (by IP address) also has a token bucket per class that refills at
+# RATE requests per second up to BURST, and is answered 429 with Retry-After when it is empty.
+# Every setting can be overridden per class, e.g. ADMISSION_AUTH_CONCURRENCY=2 or
+# ADMISSION_INFERENCE_RATE=0 (no rate limit). ADMISSION=0 turns all of it off.
+#
+# The limits and buckets are per worker process, under serve.py they apply to each worker.
+import asyncio
+import logging
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+
+from fastapi.responses import JSONResponse
+
+from metrics import ADMISSION_QUEUE_TIME, ADMISSION_REJECTIONS, ADMISSION_REQUESTS
+
+logger = logging.getLogger("travel_app.admission")
+
+DEFAULTS = {
+    "inference": {"concurrency": 8, "queue": 32, "queue_timeout": 5.0, "rate": 5.0, "burst": 20},
+    "auth": {"concurrency": 4, "queue": 16, "queue_timeout": 5.0, "rate": 2.0, "burst": 10},
+    "heavy_query": {"concurrency": 4, "queue": 16, "queue_timeout": 10.0, "rate": 5.0, "burst": 10},
+}
+
+ROUTES = [
+    ("POST", re.compile(r"^/api/v1/createComment/?$"), "inference"),
+    ("POST", re.compile(r"^/api/v1/bulkImport/?$"), "inference"),
+    ("POST", re.compile(r"^/api/v1/places/scoreAndUpdate/[^/]+/?$"), "inference"),
+    ("POST", re.compile(r"^/api/v1/(register|login)/?$"), "auth"),
+    ("GET", re.compile(r"^/api/v1/placesWithComments(/.*)?$"), "heavy_query"),
+]
+
+# Clients tracked per route class, the least recently seen are forgotten (their bucket refills)
+MAX_CLIENTS = 100000
+
+
+def is_enabled():
+    return os.environ.get("ADMISSION", "1").lower() not in ("0", "false", "no", "off")
+
+
+def trust_forwarded_for():
+    return os.environ.get("ADMISSION_TRUST_FORWARDED_FOR", "").lower() in ("1", "true", "yes", "on")
+
+
+def setting(route_class, name):
+    default = DEFAULTS[route_class][name]
+    value = os.environ.get(f"ADMISSION_{route_class.upper()}_{name.upper()}")
+    return type(default)(value) if value is not None else default
+
+
+def classify(method, path):
+    for route_method, pattern, route_class in ROUTES:
+        if method == route_method and pattern.match(path):
+            return route_class
+    return None
+
+
+# Function to identify the client a request is rate limited as
+def client_key(request):
+    if trust_forwarded_for():
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class Rejected(Exception):
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class ConcurrencyLimiter:
+    def __init__(self, route_class, limit, max_queue, queue_timeout):
+        self.route_class = route_class
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.lock = threading.Lock()  # requests may run on different event loops, e.g. under TestClient
+        self.active = 0
+        self.waiters = deque()  # futures of queued requests, a released slot is handed to the oldest
+
+    def _gauges(self):
+        ADMISSION_REQUESTS.labels(route_class=self.route_class, state="running").set(self.active)
+        ADMISSION_REQUESTS.labels(route_class=self.route_class, state="queued").set(len(self.waiters))
+
+    # Function to take a slot, waiting in the queue if needed. Returns the seconds waited
+    async def acquire(self):
+        with self.lock:
+            if self.active < self.limit and not self.waiters:
+                self.active += 1
+                self._gauges()
+                return 0.0
+            if len(self.waiters) >= self.max_queue:
+                raise Rejected("queue_full")
+            future = asyncio.get_running_loop().create_future()
+            self.waiters.append(future)
+            self._gauges()
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(future)
+            raise Rejected("queue_timeout")
+        except BaseException:
+            # client went away while queued
+            self._abandon(future)
+            raise
+        return time.perf_counter() - started
+
+    def _abandon(self, future):
+        if future.done() and not future.cancelled():
+            self.release()  # the slot was handed over just now, pass it on
+            return
+        future.cancel()
+        with self.lock:
+            try:
+                self.waiters.remove(future)
+            except ValueError:
+                pass  # already taken by release, _hand_over passes the slot on
+            self._gauges()
+
+    def _hand_over(self, future):
+        if future.done():
+            self.release()  # the waiter gave up in the meantime
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self.lock:
+            while self.waiters:
+                future = self.waiters.popleft()
+                if future.done():
+                    continue
+                try:
+                    # the slot moves to the waiter, active stays the same
+                    future.get_loop().call_soon_threadsafe(self._hand_over, future)
+                except RuntimeError:
+                    continue  # its event loop is closed
+                self._gauges()
+                return
+            self.active -= 1
+            self._gauges()
+
+
+class TokenBucketStore:
+    def __init__(self, rate, burst, max_clients=MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()  # client -> (tokens, updated at), least recently seen first
+
+    # Function to take one token for a client. Returns 0 when allowed, else the seconds until it is
+    def take(self, key, now=None):
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class RouteClassLimits:
+    def __init__(self, route_class):
+        self.route_class = route_class
+        self.limiter = ConcurrencyLimiter(route_class, setting(route_class, "concurrency"),
+                                          setting(route_class, "queue"), setting(route_class, "queue_timeout"))
+        self.buckets = TokenBucketStore(setting(route_class, "rate"), setting(route_class, "burst"))
+
+
+def reject(route_class, reason, status_code, retry_after, detail):
+    ADMISSION_REJECTIONS.labels(route_class=route_class, reason=reason).inc()
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+# Function to add the admission control middleware to a FastAPI app
+def install_middleware(app):
+    limits = {route_class: RouteClassLimits(route_class) for route_class in DEFAULTS}
+
+    @app.middleware("http")
+    async def admission_middleware(request, call_next):
+        route_class = classify(request.method, request.url.path)
+        if route_class is None:
+            return await call_next(request)
+        # the metrics middleware labels requests refused here by their route class
+        request.scope["admission_route_class"] = route_class
+        route_limits = limits[route_class]
+
+        wait = route_limits.buckets.take(client_key(request))
+        if wait:
+            return reject(route_class, "rate_limited", 429, wait, "Too many requests, slow down")
+
+        try:
+            queued = await route_limits.limiter.acquire()
+        except Rejected as e:
+            return reject(route_class, e.reason, 503, 1, "Server busy, retry shortly")
+        ADMISSION_QUEUE_TIME.labels(route_class=route_class).observe(queued)
+        try:
+            return await call_next(request)
+        finally:
+            route_limits.limiter.release()
+
+    return limits
+
+
+# Function to enable admission control on an app unless ADMISSION=0
+def install(app):
+    if not is_enabled():
+        return None
+    limits = install_middleware(app)
+    logger.info("admission control enabled %s", ", ".join(
+        f"{name}=concurrency:{lim.limiter.limit}/queue:{lim.limiter.max_queue}/rate:{lim.buckets.rate}"
+        for name, lim in limits.items()))
+    return limits
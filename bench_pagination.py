@@ -0,0 +1,104 @@
+# bench_pagination.py
+# Page latency at increasing depth, OFFSET vs keyset cursor, on a scratch sqlite database:
+#
+#   python bench_pagination.py [--comments 200000] [--page-size 20]
+#
+# OFFSET has to walk and discard every skipped row, so its latency grows with depth; the keyset
+# query seeks (place_id, commented_at, id) in the composite index and stays flat.
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, desc, insert
+from sqlalchemy.orm import Session
+
+from crud import get_comments_page_by_place_id
+from database import Base
+from models import Comment, Place, User
+from pagination import encode_cursor
+
+
+def seed(db, comments, places):
+    db.execute(insert(User), [{"id": 1, "username": "bench", "email": "bench@example.com", "hashed_password": "x"}])
+    db.execute(insert(Place), [{"id": i, "title": f"place {i}", "user_id": 1, "tags": "bench"} for i in range(1, places + 1)])
+    start = datetime(2024, 1, 1)
+    batch = []
+    for i in range(comments):
+        batch.append({
+            "user_id": 1,
+            "place_id": 1 if i % 2 == 0 else (i % places) + 1,  # place 1 holds half of all comments
+            "commented_at": start + timedelta(seconds=i),
+            "comment_text": "bench comment",
+            "email": "bench@example.com",
+            "name": "bench",
+            "label": "neutral",
+            "static_rating": 3.0,
+        })
+        if len(batch) == 10000:
+            db.execute(insert(Comment), batch)
+            batch = []
+    if batch:
+        db.execute(insert(Comment), batch)
+    db.commit()
+
+
+def offset_page(db, place_id, depth, limit):
+    return (db.query(Comment).filter(Comment.place_id == place_id)
+            .order_by(desc(Comment.commented_at), desc(Comment.id)).offset(depth).limit(limit).all())
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OFFSET vs keyset pagination of comments")
+    parser.add_argument("--comments", type=int, default=200000)
+    parser.add_argument("--places", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="travel-bench-")
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    Base.metadata.create_all(bind=engine)
+
+    try:
+        run(engine, args)
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(engine, args):
+    with Session(bind=engine) as db:
+        started = time.perf_counter()
+        seed(db, args.comments, args.places)
+        print(f"seeded {args.comments} comments in {time.perf_counter() - started:.1f}s")
+
+        total = db.query(Comment).filter(Comment.place_id == 1).count()
+        depths = [d for d in (0, 100, 1000, 10000, 50000, 100000, total - args.page_size) if 0 <= d < total]
+
+        print(f"{'depth':>10}{'offset ms':>12}{'keyset ms':>12}")
+        for depth in depths:
+            offset_ms = median_ms(lambda: offset_page(db, 1, depth, args.page_size), args.repeat)
+            cursor = None
+            if depth:
+                last = offset_page(db, 1, depth - 1, 1)[0]
+                cursor = encode_cursor(last.commented_at, last.id)
+            keyset_ms = median_ms(
+                lambda: get_comments_page_by_place_id(db, 1, limit=args.page_size, cursor=cursor), args.repeat)
+            print(f"{depth:>10}{offset_ms:>12.2f}{keyset_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
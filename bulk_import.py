@@ -0,0 +1,234 @@
+# bulk_import.py
+# Bulk ingestion of places and comments from NDJSON, one record per line:
+#
+#   {"type": "place", "ref": "p1", "title": "...", "content": "...", "tags": ["Beach"], "user_id": 1,
+#    "user_full_name": "...", "rating_score": 4.5, "img": "https://..."}
+#   {"type": "comment", "place_ref": "p1", "user_id": 2, "comment_text": "...", "email": "...",
+#    "name": "...", "static_rating": 4}
+#
+# Rows are inserted in chunked transactions, all comment texts of a chunk are scored with one
+# vectorized predict, and the sentiment counters are updated with one statement per chunk:
+#
+#   python bulk_import.py seed.ndjson [--chunk-size 500]
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, insert, update
+from sqlalchemy.orm import Session
+
+from models import Comment, Place
+from place_stats import rebuild as rebuild_place_stats
+from predictionPipeline import score_texts
+from ranking import top_places
+from schemas import BulkComment, BulkPlace
+from similar_places import similar_places
+
+logger = logging.getLogger("travel_app.bulk_import")
+
+DEFAULT_CHUNK_SIZE = 500
+
+SENTIMENT_COLUMNS = ("positive", "negative", "neutral")
+
+
+class BulkImporter:
+    def __init__(self, db: Session, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.place_refs = {}
+        self.places = []  # (line number, BulkPlace)
+        self.comments = []  # (line number, BulkComment)
+        self.places_created = 0
+        self.comments_created = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.errors.append({"line": line, "error": message})
+
+    def add_line(self, line_number, line):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            record = json.loads(line)
+            kind = record.pop("type", None)
+            if kind == "place":
+                self.places.append((line_number, BulkPlace(**record)))
+            elif kind == "comment":
+                self.comments.append((line_number, BulkComment(**record)))
+            else:
+                raise ValueError(f"unknown record type {kind!r}, expected 'place' or 'comment'")
+        except Exception as e:
+            self.error(line_number, str(e))
+            return
+
+        if len(self.places) >= self.chunk_size:
+            self.flush_places()
+        if len(self.comments) >= self.chunk_size:
+            self.flush_comments()
+
+    def flush_places(self):
+        if not self.places:
+            return
+        chunk, self.places = self.places, []
+        rows = [
+            Place(
+                img=place.img,
+                title=place.title,
+                user_id=place.user_id,
+                user_full_name=place.user_full_name,
+                posted_date=datetime.now(timezone.utc),
+                content=place.content,
+                rating_score=place.rating_score,
+                tags=",".join(place.tags),
+                negative_count=0,
+                positive_count=0,
+                neutral_count=0,
+            )
+            for _, place in chunk
+        ]
+        try:
+            self.db.add_all(rows)
+            self.db.flush()  # assigns the ids that comments refer to through place_ref
+            rebuild_place_stats(self.db, place_ids=[row.id for row in rows])
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            for line_number, _ in chunk:
+                self.error(line_number, f"place chunk failed: {e}")
+            return
+
+        for (_, place), row in zip(chunk, rows):
+            if place.ref:
+                self.place_refs[place.ref] = row.id
+        self.places_created += len(rows)
+
+    def flush_comments(self):
+        # comments may refer to places still buffered
+        self.flush_places()
+        if not self.comments:
+            return
+        chunk, self.comments = self.comments, []
+
+        resolved = []
+        for line_number, comment in chunk:
+            place_id = self.place_refs.get(comment.place_ref) if comment.place_ref else comment.place_id
+            if place_id is None:
+                self.error(line_number, f"unknown place_ref {comment.place_ref!r}" if comment.place_ref
+                           else "place_id or place_ref is required")
+                continue
+            resolved.append((line_number, comment, place_id))
+
+        known = {row.id for row in self.db.query(Place.id).filter(Place.id.in_({r[2] for r in resolved}))}
+        for line_number, _, place_id in resolved:
+            if place_id not in known:
+                self.error(line_number, f"place {place_id} does not exist")
+        resolved = [r for r in resolved if r[2] in known]
+        if not resolved:
+            return
+
+        labels, model_version = score_texts([comment.comment_text for _, comment, _ in resolved])
+        now = datetime.now(timezone.utc)
+        rows = []
+        deltas = defaultdict(lambda: dict.fromkeys(SENTIMENT_COLUMNS, 0))
+        for (_, comment, place_id), label in zip(resolved, labels):
+            rows.append({
+                "comment_text": comment.comment_text,
+                "email": comment.email,
+                "name": comment.name,
+                "place_id": place_id,
+                "user_id": comment.user_id,
+                "label": label,
+                "model_version": model_version,
+                "static_rating": comment.static_rating,
+                "commented_at": now,
+            })
+            if label in SENTIMENT_COLUMNS:
+                deltas[place_id][label] += 1
+
+        try:
+            self.db.execute(insert(Comment), rows)
+            if deltas:
+                self.db.execute(
+                    update(Place.__table__)
+                    .where(Place.__table__.c.id == bindparam("place"))
+                    .values(
+                        positive_count=Place.__table__.c.positive_count + bindparam("positive"),
+                        negative_count=Place.__table__.c.negative_count + bindparam("negative"),
+                        neutral_count=Place.__table__.c.neutral_count + bindparam("neutral"),
+                    ),
+                    [{"place": place_id, **counts} for place_id, counts in deltas.items()],
+                )
+            rebuild_place_stats(self.db, place_ids=list({row["place_id"] for row in rows}))
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            for line_number, _, _ in resolved:
+                self.error(line_number, f"comment chunk failed: {e}")
+            return
+        self.comments_created += len(rows)
+
+    def finish(self):
+        self.flush_places()
+        self.flush_comments()
+        # the ranking index picks the new rows up on its next read, the similarity table is
+        # rebuilt here so lookups stay plain reads
+        if self.places_created or self.comments_created:
+            top_places.invalidate()
+        if self.places_created:
+            try:
+                similar_places.build(self.db)
+            except Exception:
+                self.db.rollback()
+                logger.exception("similar places rebuild after bulk import failed")
+
+
+# Function to import NDJSON lines and report counts, errors and throughput
+def import_ndjson(db: Session, lines, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    started = time.perf_counter()
+    importer = BulkImporter(db, chunk_size=chunk_size)
+    for line_number, line in enumerate(lines, 1):
+        importer.add_line(line_number, line.decode("utf-8") if isinstance(line, bytes) else line)
+    importer.finish()
+
+    elapsed = time.perf_counter() - started
+    rows = importer.places_created + importer.comments_created
+    result = {
+        "places_created": importer.places_created,
+        "comments_created": importer.comments_created,
+        "errors": importer.errors,
+        "duration_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed > 0 else None,
+    }
+    logger.info("bulk import places=%d comments=%d errors=%d duration_ms=%.1f rows_per_sec=%s",
+                importer.places_created, importer.comments_created, len(importer.errors),
+                elapsed * 1000, result["rows_per_second"])
+    return result
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Bulk import places and comments from an NDJSON file")
+    parser.add_argument("path", help="NDJSON file, '-' for stdin")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+    source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8")
+    db = SessionLocal()
+    try:
+        result = import_ndjson(db, source, chunk_size=args.chunk_size)
+    finally:
+        db.close()
+        if source is not sys.stdin:
+            source.close()
+    errors = result.pop("errors")
+    for error in errors[:20]:
+        print(f"line {error['line']}: {error['error']}")
+    print(json.dumps({**result, "errors": len(errors)}))
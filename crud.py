@@ -1,49 +1,76 @@
 # crud.py
+import logging
 import os
+import time
 from datetime import datetime
+from functools import lru_cache
 
-import boto3
-from botocore.exceptions import NoCredentialsError
 from dotenv import load_dotenv
 from fastapi import UploadFile, Form
-from passlib.context import CryptContext
-from sqlalchemy import desc, and_
-from sqlalchemy.orm import Session
-
-from models import UserRoles, User, Place, Comment
+from sqlalchemy import desc, and_, tuple_
+from sqlalchemy.orm import Session, joinedload
+
+from events import hub
+from metrics import S3_UPLOAD_DURATION
+from models import UserRoles, User, Place, Comment, PlaceStats
+from pagination import decode_cursor, page_of
+from place_stats import apply_comment, get_stats_by_place_ids, stats_fields
+from ranking import top_places
+from similar_places import similar_places
 from response import create_response
 from schemas import PlaceCreate, CommentCreate, CommentResponse
-from predictionPipeline import analyze_text
+from predictionPipeline import score_text
 
 # Load environment variables from .env file
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger("travel_app.crud")
+
+# boto3 and passlib are imported on first use, they are slow to import and not every worker needs them
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 # Function to hash a password
 def get_password_hash(password: str):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+# Function to build the s3 client, S3_ENDPOINT_URL points uploads at a local S3 stand-in
+def get_s3_client():
+    import boto3
+    return boto3.client('s3', aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+                        aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+                        region_name=os.environ.get("REGION_NAME"),
+                        endpoint_url=os.environ.get("S3_ENDPOINT_URL"))
 
 # Common Function to upload images to aws s3 bucket
 def upload_to_aws(file, bucket, s3_file, acl="public-read"):
-    print(f"Uploading {s3_file} to {bucket}")
+    from botocore.exceptions import NoCredentialsError
 
-    s3 = boto3.client('s3', aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
-                      aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
-                      region_name=os.environ.get("REGION_NAME"))
+    s3 = get_s3_client()
+    started = time.perf_counter()
+    outcome = "success"
     try:
         # Ensure the file cursor is at the beginning before uploading
         file.seek(0)
         s3.upload_fileobj(file, bucket, s3_file, ExtraArgs={'ACL': acl})
-        print("Upload Successful")
         return True
     except FileNotFoundError:
-        print("The file was not found")
+        outcome = "file_not_found"
         return False
     except NoCredentialsError:
-        print("Credentials not available")
+        outcome = "no_credentials"
         return False
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        S3_UPLOAD_DURATION.labels(outcome=outcome).observe(elapsed)
+        logger.info("s3 upload bucket=%s key=%s outcome=%s duration_ms=%.1f",
+                    bucket, s3_file, outcome, elapsed * 1000)
 
 # Function to create new user and saved
 def create_user(
@@ -81,10 +108,19 @@ def get_user(db: Session, user_id: int):
 def get_users(db: Session, skip: int = 0, limit: int = 10):
     return db.query(User).offset(skip).limit(limit).all()
 
+# Function to get a page of users ordered by id, after the user id in the cursor
+def get_users_page(db: Session, limit: int = 10, cursor: str = None):
+    query = db.query(User)
+    if cursor:
+        (after_id,) = decode_cursor(cursor, types=(int,))
+        query = query.filter(User.id > after_id)
+    users = query.order_by(User.id).limit(limit + 1).all()
+    return page_of(users, limit, key=lambda user: (user.id,))
+
 # Function to user authentication
 def authenticate_user(db: Session, username: str, password: str):
     user = db.query(User).filter(User.email == username).first()
-    if user and pwd_context.verify(password, user.hashed_password):
+    if user and get_pwd_context().verify(password, user.hashed_password):
         return user
     return None
 
@@ -119,10 +155,20 @@ def create_place(db: Session, place: PlaceCreate, img: UploadFile):
                 rating_score=place.rating_score,
                 tags=tags_str
             )
+            # zeroed stats row in the same transaction, so comment writes only ever UPDATE it
+            place_db.stats = PlaceStats(comment_count=0, rated_count=0, static_rating_sum=0.0,
+                                        positive_count=0, negative_count=0, neutral_count=0)
 
             db.add(place_db)
             db.commit()
             db.refresh(place_db)
+            top_places.refresh_place(db, place_db.id)
+            try:
+                similar_places.add_place(db, place_db)
+            except Exception:
+                # recommendations are derived data, never fail the place creation for them
+                db.rollback()
+                logger.exception("similar places update failed place_id=%s", place_db.id)
 
             return place_db
         else:
@@ -137,16 +183,16 @@ def create_place(db: Session, place: PlaceCreate, img: UploadFile):
 
 # Function to get places by userId
 def get_places_by_user_id(db: Session, user_id: int):
-    return db.query(Place).filter(Place.user_id == user_id).all()
+    return db.query(Place).options(joinedload(Place.stats)).filter(Place.user_id == user_id).all()
 
 # Function to get places by placeId
 def get_place_by_place_id(db: Session, place_id: int):
-    return db.query(Place).filter(Place.id == place_id).first()
+    return db.query(Place).options(joinedload(Place.stats)).filter(Place.id == place_id).first()
 
 # Function to create comment
 def create_comment(db: Session, comment: CommentCreate):
     # Get sentiment analysis result
-    sentiment = analyze_text(comment.comment_text)
+    sentiment, model_version = score_text(comment.comment_text)
     
     # Get the place from db
     place = db.query(Place).filter(Place.id == comment.place_id).first()
@@ -169,14 +215,64 @@ def create_comment(db: Session, comment: CommentCreate):
         place_id=comment.place_id,
         user_id=comment.user_id,
         label=sentiment,
+        model_version=model_version,
         static_rating=comment.static_rating
     )
     
     db.add(db_comment)
-    db.commit()  # This commit will save both the comment and place changes
+    db.flush()
+    apply_comment(db, db_comment)
+    db.commit()  # This commit will save the comment, place and place stats changes
     db.refresh(db_comment)
+    top_places.refresh_place(db, db_comment.place_id)
+    publish_comment_event(db, "comment", db_comment)
     return db_comment
 
+# Function to delete comment and take it out of the place counters
+def delete_comment(db: Session, comment_id: int):
+    comment = db.query(Comment).filter(Comment.id == comment_id).first()
+    if not comment:
+        return None
+
+    place = db.query(Place).filter(Place.id == comment.place_id).first()
+    if place:
+        if comment.label == 'negative':
+            place.negative_count -= 1
+        elif comment.label == 'positive':
+            place.positive_count -= 1
+        elif comment.label == 'neutral':
+            place.neutral_count -= 1
+
+    db.delete(comment)
+    db.flush()
+    apply_comment(db, comment, sign=-1)
+    db.commit()
+    top_places.refresh_place(db, comment.place_id)
+    publish_comment_event(db, "comment_deleted", comment)
+    return comment
+
+# Function to push a comment change and the place's new counters to its event stream subscribers
+def publish_comment_event(db: Session, event_type: str, comment: Comment):
+    if not hub.has_subscribers(comment.place_id):
+        return
+    stats = db.query(PlaceStats).filter(PlaceStats.place_id == comment.place_id).first()
+    hub.publish(comment.place_id, event_type, {
+        "comment": {
+            "comment_id": comment.id,
+            "comment_text": comment.comment_text,
+            "name": comment.name,
+            "commented_at": comment.commented_at,
+            "user_id": comment.user_id,
+            "place_id": comment.place_id,
+            "static_rating": comment.static_rating,
+            "label": comment.label,
+        },
+        **stats_fields(stats),
+        "negative_sentiment_count": stats.negative_count if stats else 0,
+        "positive_sentiment_count": stats.positive_count if stats else 0,
+        "neutral_sentiment_count": stats.neutral_count if stats else 0,
+    })
+
 # Function to get comments by userId
 def get_comments_by_user_id(db: Session, user_id: int):
     return db.query(Comment).filter(Comment.user_id == user_id).all()
@@ -185,10 +281,28 @@ def get_comments_by_user_id(db: Session, user_id: int):
 def get_comments_by_place_id(db: Session, place_id: int):
     return db.query(Comment).filter(Comment.place_id == place_id).all()
 
+# Function to get a page of comments newest first, continuing after the (commented_at, id) cursor
+def _comments_page(db: Session, column, value, limit: int, cursor: str = None):
+    query = db.query(Comment).filter(column == value)
+    if cursor:
+        commented_at, comment_id = decode_cursor(cursor, types=(datetime, int))
+        query = query.filter(tuple_(Comment.commented_at, Comment.id) < tuple_(commented_at, comment_id))
+    comments = query.order_by(desc(Comment.commented_at), desc(Comment.id)).limit(limit + 1).all()
+    return page_of(comments, limit, key=lambda comment: (comment.commented_at, comment.id))
+
+# Function to get a page of comments by placeId
+def get_comments_page_by_place_id(db: Session, place_id: int, limit: int = 20, cursor: str = None):
+    return _comments_page(db, Comment.place_id, place_id, limit, cursor)
+
+# Function to get a page of comments by userId
+def get_comments_page_by_user_id(db: Session, user_id: int, limit: int = 20, cursor: str = None):
+    return _comments_page(db, Comment.user_id, user_id, limit, cursor)
+
 # Function to get All places with comments
 def get_all_places_with_comments(db: Session):
     places = db.query(Place).all()
     places_with_comments = []
+    stats_by_place = get_stats_by_place_ids(db, [place.id for place in places])
 
     for place in places:
         comments = get_comments_by_place_id(db, place.id)
@@ -226,6 +340,7 @@ def get_all_places_with_comments(db: Session):
             "rating_score": place.rating_score,
             "posted_date": place.posted_date,
             "user_image": user.user_img,
+            **stats_fields(stats_by_place.get(place.id)),
             "comments": comments_response
         }
 
@@ -237,10 +352,12 @@ def get_all_places_with_comments(db: Session):
 def get_all_places_with_comments_by_place_id(db: Session, place_id: int):
     places = db.query(Place).filter(Place.id == place_id).all()
     places_with_comments_by_id = []
+    stats_by_place = get_stats_by_place_ids(db, [place.id for place in places])
 
     for place in places:
         comments = get_comments_by_place_id(db, place.id)
         user = get_user(db, place.user_id)
+        stats = stats_by_place.get(place.id)
 
         comments_response = []
 
@@ -274,9 +391,10 @@ def get_all_places_with_comments_by_place_id(db: Session, place_id: int):
             "rating_score": place.rating_score,
             "posted_date": place.posted_date,
             "user_image": user.user_img,
-            "negative_sentiment_count": place.negative_count,
-            "positive_sentiment_count": place.positive_count,
-            "neutral_sentiment_count": place.neutral_count,
+            **stats_fields(stats),
+            "negative_sentiment_count": stats.negative_count if stats else 0,
+            "positive_sentiment_count": stats.positive_count if stats else 0,
+            "neutral_sentiment_count": stats.neutral_count if stats else 0,
             "comments": comments_response
         }
 
@@ -289,6 +407,7 @@ def get_all_places_with_comments_by_place_id(db: Session, place_id: int):
 def get_places_by_tag(db: Session, tag: str, min: float, max: float):
     places = db.query(Place).filter(Place.tags.ilike(f"%{tag}%")).filter(and_(Place.rating_score >= min, Place.rating_score <= max)).order_by(desc(Place.rating_score)).all()
     places_with_comments_result = []
+    stats_by_place = get_stats_by_place_ids(db, [place.id for place in places])
 
     for place in places:
         comments = get_comments_by_place_id(db, place.id)
@@ -324,6 +443,7 @@ def get_places_by_tag(db: Session, tag: str, min: float, max: float):
             "rating_score": place.rating_score,
             "posted_date": place.posted_date,
             "user_image": user.user_img,
+            **stats_fields(stats_by_place.get(place.id)),
             "comments": comments_response
         }
 
@@ -332,6 +452,16 @@ def get_places_by_tag(db: Session, tag: str, min: float, max: float):
     return places_with_comments_result
 
 
+# Function to get the best ranked places, served from the in-memory ranking index
+def get_top_places(db: Session, limit: int = 10, tag: str = None):
+    return top_places.top(db, limit=limit, tag=tag)
+
+
+# Function to get the places most similar to a place, from the precomputed neighbour table
+def get_similar_places(db: Session, place_id: int, limit: int = 10):
+    return similar_places.similar(db, place_id, limit=limit)
+
+
 # Add a new function to search for places and comments
 def get_all_places_with_comments_by_search_text(db: Session, search_text: str):
     # Perform a case-insensitive search for places and comments where title or tags contain the search text
@@ -341,6 +471,7 @@ def get_all_places_with_comments_by_search_text(db: Session, search_text: str):
     ).all()
 
     places_with_comments = []
+    stats_by_place = get_stats_by_place_ids(db, [place.id for place in places])
 
     for place in places:
         comments = db.query(Comment).filter(Comment.place_id == place.id).all()
@@ -376,6 +507,7 @@ def get_all_places_with_comments_by_search_text(db: Session, search_text: str):
             "rating_score": place.rating_score,
             "posted_date": place.posted_date,
             "user_image": user.user_img,
+            **stats_fields(stats_by_place.get(place.id)),
             "comments": comments_response
         }
 
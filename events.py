@@ -0,0 +1,132 @@
+# events.py
+# In-process pub/sub hub that pushes new comments, their sentiment label and the updated place
+# counters to clients subscribed to a place over Server-Sent Events, instead of clients polling
+# getCommentsByPlaceId / placesWithComments.
+#
+# Every subscriber has a bounded queue. A client that does not keep up is sent an "overflow" event
+# and disconnected so it can re-sync over REST, and it never blocks the writer. Connections are
+# capped in total (SSE_MAX_CONNECTIONS) and per place (SSE_MAX_CONNECTIONS_PER_PLACE).
+#
+# The hub is per worker process: with several workers a client only sees events for writes served
+# by the worker it is connected to.
+import asyncio
+import json
+import os
+import threading
+from datetime import datetime
+
+HEARTBEAT_SECONDS = 15
+
+
+def max_connections():
+    return int(os.environ.get("SSE_MAX_CONNECTIONS", "1000"))
+
+
+def max_connections_per_place():
+    return int(os.environ.get("SSE_MAX_CONNECTIONS_PER_PLACE", "200"))
+
+
+def queue_size():
+    return int(os.environ.get("SSE_QUEUE_SIZE", "100"))
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class Subscriber:
+    def __init__(self, place_id, loop):
+        self.place_id = place_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=queue_size())
+        self.overflowed = False
+
+    # Runs on the subscriber's event loop
+    def _offer(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # wake the consumer so it can tell the client and disconnect
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class EventHub:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}  # place_id -> set of Subscriber
+
+    @property
+    def connection_count(self):
+        with self.lock:
+            return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+    def has_subscribers(self, place_id):
+        return bool(self.subscribers.get(place_id))
+
+    def subscribe(self, place_id):
+        subscriber = Subscriber(place_id, asyncio.get_running_loop())
+        with self.lock:
+            total = sum(len(subscribers) for subscribers in self.subscribers.values())
+            if total >= max_connections():
+                raise TooManySubscribers("Too many event stream connections")
+            if len(self.subscribers.get(place_id, ())) >= max_connections_per_place():
+                raise TooManySubscribers("Too many event stream connections for this place")
+            self.subscribers.setdefault(place_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(subscriber.place_id)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[subscriber.place_id]
+
+    # Function to fan an event out to a place's subscribers, safe to call from worker threads
+    def publish(self, place_id, event_type, data):
+        with self.lock:
+            subscribers = list(self.subscribers.get(place_id, ()))
+        event = (event_type, data)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber._offer, event)
+            except RuntimeError:
+                # the subscriber's loop is closed, its stream is gone
+                self.unsubscribe(subscriber)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def format_event(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data, default=_default)}\n\n"
+
+
+# Async generator of SSE frames for one subscriber, ends when the client goes away or lags behind
+async def stream(request, subscriber):
+    try:
+        yield format_event("subscribed", {"place_id": subscriber.place_id})
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            if event is None or subscriber.overflowed:
+                yield format_event("overflow", {"reason": "client too slow, re-sync over REST"})
+                return
+            yield format_event(*event)
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+hub = EventHub()
@@ -0,0 +1,335 @@
+# loadtest.py
+# Load generator for the travel app API.
+#
+# Runs a weighted mix of register/login/createPlace/createComment/placesWithComments/search
+# requests at a fixed concurrency and reports p50/p95/p99 latency and throughput per route.
+#
+#   python loadtest.py                                   # in-process main:app, scratch db, local s3 stand-in
+#   python loadtest.py --base-url http://127.0.0.1:8000  # against a running server
+#   python loadtest.py --concurrency 16 --duration 60 --mix createComment=5,placesWithComments=5
+import argparse
+import io
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+DEFAULT_MIX = {
+    "register": 1,
+    "login": 3,
+    "createPlace": 1,
+    "createComment": 3,
+    "placesWithComments": 4,
+    "search": 3,
+}
+
+SAMPLE_COMMENTS = [
+    "Amazing view and very friendly people, would visit again",
+    "The place was dirty and the staff were rude",
+    "It was okay, nothing special to say",
+    "Beautiful beach, calm water and great food",
+    "Too crowded and overpriced, not worth the trip",
+]
+
+SAMPLE_TAGS = ["beach", "hiking", "temple", "waterfall", "city", "wildlife"]
+
+# A 1x1 transparent png used for every image upload
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082"
+)
+
+
+# Local S3 stand-in, writes uploads to a directory instead of the bucket
+class LocalS3Client:
+    def __init__(self, root):
+        self.root = root
+
+    def upload_fileobj(self, file, bucket, key, ExtraArgs=None):
+        path = os.path.join(self.root, bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(file, f)
+
+
+# Function to compute a nearest-rank percentile from sorted samples
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(sorted_samples)) - 1
+    return sorted_samples[min(max(rank, 0), len(sorted_samples) - 1)]
+
+
+# Function to parse "route=weight,route=weight" into a mix dict
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        route, _, weight = part.partition("=")
+        route = route.strip()
+        if route not in DEFAULT_MIX:
+            raise ValueError(f"Unknown route '{route}', expected one of {', '.join(DEFAULT_MIX)}")
+        mix[route] = float(weight or 1)
+    return mix
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            self.latencies[route].append(seconds)
+            if not ok:
+                self.errors[route] += 1
+
+    def report(self, elapsed):
+        header = f"{'route':<20}{'count':>8}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        lines = [header, "-" * len(header)]
+        total = 0
+        for route in sorted(self.latencies):
+            samples = sorted(self.latencies[route])
+            total += len(samples)
+            lines.append(
+                f"{route:<20}{len(samples):>8}{self.errors[route]:>8}{len(samples) / elapsed:>10.1f}"
+                f"{percentile(samples, 50) * 1000:>10.1f}{percentile(samples, 95) * 1000:>10.1f}"
+                f"{percentile(samples, 99) * 1000:>10.1f}{samples[-1] * 1000:>10.1f}"
+            )
+        lines.append("-" * len(header))
+        lines.append(f"total {total} requests in {elapsed:.1f}s, {total / elapsed:.1f} req/s")
+        return "\n".join(lines)
+
+
+# Shared state of seeded users and places that the traffic mix picks from
+class Population:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = []  # (user_id, email, password)
+        self.places = []  # (place_id, tag)
+
+    def add_user(self, user):
+        with self.lock:
+            self.users.append(user)
+
+    def add_place(self, place):
+        with self.lock:
+            self.places.append(place)
+
+    def random_user(self, rnd):
+        with self.lock:
+            return rnd.choice(self.users)
+
+    def random_place(self, rnd):
+        with self.lock:
+            return rnd.choice(self.places)
+
+
+def _ok(response):
+    if response.status_code >= 400:
+        return False
+    try:
+        body = response.json()
+    except ValueError:
+        return False
+    return not (isinstance(body, dict) and body.get("status") == "error")
+
+
+def do_register(client, population, rnd):
+    email = f"load-{uuid.uuid4().hex}@example.com"
+    password = "secret-" + uuid.uuid4().hex[:8]
+    response = client.post(
+        "/api/v1/register",
+        data={"username": email.split("@")[0], "email": email, "password": password},
+        files={"user_img": ("avatar.png", io.BytesIO(PNG_BYTES), "image/png")},
+    )
+    if _ok(response):
+        population.add_user((response.json()["data"]["user_id"], email, password))
+    return response
+
+
+def do_login(client, population, rnd):
+    _, email, password = population.random_user(rnd)
+    return client.post("/api/v1/login", json={"username": email, "password": password})
+
+
+def do_create_place(client, population, rnd):
+    user_id, email, _ = population.random_user(rnd)
+    tags = rnd.sample(SAMPLE_TAGS, 2)
+    response = client.post(
+        "/api/v1/createPlace/",
+        data={
+            "title": f"{tags[0].title()} spot {uuid.uuid4().hex[:6]}",
+            "content": rnd.choice(SAMPLE_COMMENTS),
+            "tags": ",".join(tags),
+            "user_id": str(user_id),
+            "user_full_name": email.split("@")[0],
+            "rating_score": str(round(rnd.uniform(0, 5), 1)),
+        },
+        files={"img": ("place.png", io.BytesIO(PNG_BYTES), "image/png")},
+    )
+    if _ok(response):
+        population.add_place((response.json()["data"]["place_id"], tags[0]))
+    return response
+
+
+def do_create_comment(client, population, rnd):
+    user_id, email, _ = population.random_user(rnd)
+    place_id, _ = population.random_place(rnd)
+    return client.post(
+        "/api/v1/createComment",
+        json={
+            "comment_text": rnd.choice(SAMPLE_COMMENTS),
+            "email": email,
+            "name": email.split("@")[0],
+            "static_rating": round(rnd.uniform(0, 5), 1),
+            "place_id": place_id,
+            "user_id": user_id,
+        },
+    )
+
+
+def do_places_with_comments(client, population, rnd):
+    if rnd.random() < 0.5:
+        return client.get("/api/v1/placesWithComments")
+    place_id, _ = population.random_place(rnd)
+    return client.get(f"/api/v1/placesWithComments/{place_id}")
+
+
+def do_search(client, population, rnd):
+    _, tag = population.random_place(rnd)
+    return client.get(f"/api/v1/placesWithComments/search/{tag}")
+
+
+ACTIONS = {
+    "register": do_register,
+    "login": do_login,
+    "createPlace": do_create_place,
+    "createComment": do_create_comment,
+    "placesWithComments": do_places_with_comments,
+    "search": do_search,
+}
+
+
+# Function to build an in-process client against main:app with a scratch db and local s3
+def in_process_client_factory(workdir):
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'loadtest.db')}")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # every simulated user shares the test client's address, keep the concurrency limits but not
+    # the per-client rate limits
+    import admission
+    for route_class in admission.DEFAULTS:
+        os.environ.setdefault(f"ADMISSION_{route_class.upper()}_RATE", "0")
+
+    import crud
+    crud.get_s3_client = lambda: LocalS3Client(os.path.join(workdir, "s3"))
+
+    from fastapi.testclient import TestClient
+    import main
+    import migrations
+
+    # TestClient only runs startup handlers inside a with block, create the schema up front
+    migrations.upgrade()
+    return lambda: TestClient(main.app)
+
+
+def remote_client_factory(base_url):
+    import httpx
+    return lambda: httpx.Client(base_url=base_url, timeout=60)
+
+
+def seed(client, population, users, places, rnd):
+    for _ in range(users):
+        do_register(client, population, rnd)
+    if not population.users:
+        raise RuntimeError("Could not register any seed user, is the target reachable?")
+    for _ in range(places):
+        do_create_place(client, population, rnd)
+    if not population.places:
+        raise RuntimeError("Could not create any seed place, is S3 reachable?")
+
+
+def run(client_factory, mix, concurrency, duration, requests, seed_users, seed_places, rnd_seed):
+    population = Population()
+    recorder = Recorder()
+    seed(client_factory(), population, seed_users, seed_places, random.Random(rnd_seed))
+
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+    budget = {"left": requests}
+    budget_lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def take():
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        if budget["left"] is None:
+            return True
+        with budget_lock:
+            if budget["left"] <= 0:
+                return False
+            budget["left"] -= 1
+            return True
+
+    def worker(index):
+        rnd = random.Random(rnd_seed + index + 1)
+        client = client_factory()
+        while take():
+            route = rnd.choices(routes, weights)[0]
+            started = time.perf_counter()
+            try:
+                ok = _ok(ACTIONS[route](client, population, rnd))
+            except Exception:
+                ok = False
+            recorder.record(route, time.perf_counter() - started, ok)
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drive a realistic traffic mix against the travel app API")
+    parser.add_argument("--base-url", help="Target a running server instead of the in-process main:app")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to run (default: use --requests)")
+    parser.add_argument("--requests", type=int, default=500, help="Total requests when --duration is not set")
+    parser.add_argument("--mix", help="Weighted route mix, e.g. login=3,createComment=2 (default: %s)"
+                        % ",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument("--seed-users", type=int, default=10)
+    parser.add_argument("--seed-places", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42, help="Random seed for a reproducible mix")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    requests = None if args.duration else args.requests
+
+    workdir = None
+    if args.base_url:
+        client_factory = remote_client_factory(args.base_url)
+    else:
+        workdir = tempfile.mkdtemp(prefix="travel-loadtest-")
+        client_factory = in_process_client_factory(workdir)
+
+    try:
+        recorder, elapsed = run(client_factory, mix, args.concurrency, args.duration, requests,
+                                args.seed_users, args.seed_places, args.seed)
+        print(recorder.report(elapsed))
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,64 @@
+import hmac
+import logging
 import os
+import time
+from contextlib import asynccontextmanager
 
-from fastapi import Depends, FastAPI, File, Form, HTTPException
+from fastapi import Depends, FastAPI, File, Form, Header, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
-from typing import List
+from typing import List, Optional
 from fastapi import UploadFile
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from crud import create_user, authenticate_user, get_users, get_user, delete_user_from_db, create_place, \
-    get_places_by_user_id, get_place_by_place_id, create_comment, get_comments_by_user_id, get_comments_by_place_id, \
-    get_all_places_with_comments, get_all_places_with_comments_by_place_id, get_places_by_tag, \
-    get_all_places_with_comments_by_search_text
+    get_places_by_user_id, get_place_by_place_id, create_comment, delete_comment, get_comments_by_user_id, \
+    get_comments_by_place_id, get_all_places_with_comments, get_all_places_with_comments_by_place_id, \
+    get_places_by_tag, get_all_places_with_comments_by_search_text, get_top_places, get_similar_places, \
+    get_users_page, get_comments_page_by_place_id, get_comments_page_by_user_id
 from response import create_response
 from schemas import User, UserLogin, PlaceCreate, PlaceResponse, PlaceGetByUserId, PlaceGetByPlaceId, CommentCreate, \
     CommentByUserIdResponse, CommentByPlaceIdResponse
 
 
+import admission
+from bulk_import import DEFAULT_CHUNK_SIZE, import_ndjson
 from database import SessionLocal, engine
-from models import Base
-Base.metadata.create_all(bind=engine)
-app = FastAPI()
+import events
+from pagination import InvalidCursor, clamp_limit
+from metrics import install_middleware, instrument_engine, render_latest
+import migrations
+from model_registry import UnknownModelVersion, registry as model_registry
+import sqlprofiler
+
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+logger = logging.getLogger("travel_app.api")
+
+instrument_engine(engine)
+
+
+# Schema creation runs once at startup rather than at import time, see migrations.py
+@asynccontextmanager
+async def lifespan(app):
+    if migrations.auto_migrate_enabled():
+        migrations.upgrade(engine)
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# Concurrency limits with bounded queues and per-client rate limits for the expensive routes.
+# Installed first so it runs inside the metrics middleware, which also records the rejections,
+# under route="admission:<route class>" as they never reach the router
+admission.install(app)
+
+# Record per-route latency and per-request SQL statement counts
+install_middleware(app)
+
+# Opt-in per-request SQL profiling, slow query log and N+1 detection (SQL_PROFILE=1)
+sqlprofiler.install(app, engine)
 
 # Enable CORS (Cross-Origin Resource Sharing) for all origins
 app.add_middleware(
@@ -31,6 +70,13 @@ app.add_middleware(
 )
 
 
+# Prometheus scrape endpoint
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+
 # Dependency to get the current user from the database
 def get_db():
     db = SessionLocal()
@@ -74,6 +120,20 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
 def get_all_users(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
     return get_users(db, skip=skip, limit=limit)
 
+
+# API to get users page by page, pass the returned next_cursor to get the following page
+@app.get("/api/v1/users/page", response_model=dict)
+def get_users_page_endpoint(limit: int = 10, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    try:
+        users, next_cursor = get_users_page(db, limit=clamp_limit(limit), cursor=cursor)
+    except InvalidCursor as e:
+        return create_response("error", str(e), data=None)
+    users_data = [
+        {"id": user.id, "username": user.username, "email": user.email, "user_img": user.user_img}
+        for user in users
+    ]
+    return create_response("success", "Successfully fetched", data={"data": users_data, "next_cursor": next_cursor})
+
 #===================================================
 # API to get a specific user
 @app.get("/api/v1/users/{user_id}")
@@ -148,6 +208,21 @@ def create_place_endpoint(
         return create_response("error", f"Internal Server Error: {str(e)}", data=None)
 
 
+# API to bulk import places and comments from an NDJSON file, see bulk_import.py for the format
+@app.post("/api/v1/bulkImport")
+def bulk_import_endpoint(
+        file: UploadFile = File(...),
+        chunk_size: int = Form(DEFAULT_CHUNK_SIZE),
+        db: Session = Depends(get_db),
+):
+    try:
+        result = import_ndjson(db, file.file, chunk_size=max(min(chunk_size, 5000), 1))
+        return create_response("success", "Bulk import finished", data=result)
+    except Exception as e:
+        db.rollback()
+        return create_response("error", f"Internal Server Error: {str(e)}", data=None)
+
+
 # API to get places by user ID
 @app.post("/api/v1/places/getByUserId", response_model=List[PlaceResponse])
 def get_places_by_user_id_endpoint(user_data: PlaceGetByUserId, db: Session = Depends(get_db)):
@@ -182,6 +257,34 @@ def create_comment_endpoint(comment: CommentCreate, db: Session = Depends(get_db
         return create_response("error", f"Internal Server Error: {str(e)}", data=None)
 
 
+# API to delete a comment, the place statistics are updated in the same transaction
+@app.delete("/api/v1/comments/{comment_id}")
+def delete_comment_endpoint(comment_id: int, db: Session = Depends(get_db)):
+    try:
+        deleted_comment = delete_comment(db, comment_id)
+        if deleted_comment:
+            return create_response("success", "Comment deleted successfully", data=None)
+        else:
+            return create_response("error", "Comment not found", data=None)
+    except Exception as e:
+        db.rollback()
+        return create_response("error", f"Internal Server Error: {str(e)}", data=None)
+
+
+# API to subscribe to a place's new comments and sentiment counters over Server-Sent Events
+@app.get("/api/v1/places/{place_id}/events")
+async def place_events_endpoint(place_id: int, request: Request):
+    try:
+        subscriber = events.hub.subscribe(place_id)
+    except events.TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return StreamingResponse(
+        events.stream(request, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # API to get comments by userId in related user
 @app.get("/api/v1/getCommentsByUserId/{user_id}", response_model=List[CommentByUserIdResponse])
 def get_comments_by_user_id_endpoint(user_id: int, db: Session = Depends(get_db)):
@@ -203,6 +306,44 @@ def get_comments_by_user_id_endpoint(user_id: int, db: Session = Depends(get_db)
 
     return comments_response
 
+def comments_page_response(comments, next_cursor):
+    comments_response = [
+        CommentByUserIdResponse(
+            comment_id=comment.id,
+            comment_text=comment.comment_text,
+            email=comment.email,
+            name=comment.name,
+            commented_at=comment.commented_at,
+            user_id=comment.user_id,
+            place_id=comment.place_id
+        )
+        for comment in comments
+    ]
+    return create_response("success", "Successfully fetched", data={"data": comments_response, "next_cursor": next_cursor})
+
+
+# API to get comments by userId page by page, newest first
+@app.get("/api/v1/getCommentsByUserId/{user_id}/page", response_model=dict)
+def get_comments_page_by_user_id_endpoint(user_id: int, limit: int = 20, cursor: Optional[str] = None,
+                                          db: Session = Depends(get_db)):
+    try:
+        comments, next_cursor = get_comments_page_by_user_id(db, user_id, limit=clamp_limit(limit), cursor=cursor)
+    except InvalidCursor as e:
+        return create_response("error", str(e), data=None)
+    return comments_page_response(comments, next_cursor)
+
+
+# API to get comments by placeId page by page, newest first
+@app.get("/api/v1/getCommentsByPlaceId/{place_id}/page", response_model=dict)
+def get_comments_page_by_place_id_endpoint(place_id: int, limit: int = 20, cursor: Optional[str] = None,
+                                           db: Session = Depends(get_db)):
+    try:
+        comments, next_cursor = get_comments_page_by_place_id(db, place_id, limit=clamp_limit(limit), cursor=cursor)
+    except InvalidCursor as e:
+        return create_response("error", str(e), data=None)
+    return comments_page_response(comments, next_cursor)
+
+
 # API to get comments by placeId in related place
 @app.get("/api/v1/getCommentsByPlaceId/{place_id}", response_model=List[CommentByPlaceIdResponse])
 def get_comments_by_place_id_endpoint(place_id: int, db: Session = Depends(get_db)):
@@ -274,6 +415,38 @@ def get_places_by_tag_endpoint(tag: str = Form(...), minscore: float = Form(...)
         error_message = "Failed to fetch data. Reason: {}".format(str(e))
         raise HTTPException(status_code=500, detail=error_message)
 
+# API to get the top ranked places (Wilson lower bound of sentiment blended with static rating)
+@app.get("/api/v1/places/top", response_model=dict)
+def get_top_places_endpoint(limit: int = 10, tag: Optional[str] = None, db: Session = Depends(get_db)):
+    try:
+        top = get_top_places(db, limit=max(min(limit, 100), 1), tag=tag)
+        response_data = {
+            "status": "success",
+            "message": "Successfully fetched",
+            "data": {"data": top}
+        }
+        return response_data
+    except Exception as e:
+        error_message = f"Failed to fetch data. Reason: {str(e)}"
+        raise HTTPException(status_code=500, detail=error_message)
+
+
+# API to get places similar to a place (tf-idf cosine similarity over title, tags and content)
+@app.get("/api/v1/places/{place_id}/similar", response_model=dict)
+def get_similar_places_endpoint(place_id: int, limit: int = 10, db: Session = Depends(get_db)):
+    try:
+        similar = get_similar_places(db, place_id, limit=max(min(limit, 50), 1))
+        response_data = {
+            "status": "success",
+            "message": "Successfully fetched",
+            "data": {"data": similar}
+        }
+        return response_data
+    except Exception as e:
+        error_message = f"Failed to fetch data. Reason: {str(e)}"
+        raise HTTPException(status_code=500, detail=error_message)
+
+
 # Add a new API endpoint for searching places and comments
 @app.get("/api/v1/placesWithComments/search/{search_text}", response_model=dict)
 def search_places_and_comments(search_text: str, db: Session = Depends(get_db)
@@ -310,18 +483,14 @@ def score_and_update_place(
         # Extract comment text from each comment
         comments_list = [comment.comment_text for comment in comments]
 
-        print("comments", comments_list)
-
         # Use your machine learning model to score the comments
+        started = time.perf_counter()
         scores = [predict_score(comment) for comment in comments_list]
 
-        print("scores total ---> ", scores)
-        print("sum of score ---> ", sum(scores))
-        print("length of score ---> ", len(scores))
-
         # Calculate the average score
         avg_score = sum(scores) / len(scores)
-        print("avg of score ---> ", avg_score )
+        logger.info("scored place place_id=%s comments=%d score_sum=%s avg_score=%s duration_ms=%.1f",
+                    place_id, len(scores), sum(scores), avg_score, (time.perf_counter() - started) * 1000)
 
         # Update the place rating_score in the database
         place = get_place_by_place_id(db, place_id)
@@ -337,3 +506,51 @@ def score_and_update_place(
         return create_response("error", f"Internal Server Error: {str(e)}", data=None)
 
 
+# Dependency guarding the admin APIs: the X-Admin-Token header must match ADMIN_TOKEN, and without
+# ADMIN_TOKEN set they are disabled
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=403, detail="Admin APIs are disabled, set ADMIN_TOKEN to enable them")
+    if not hmac.compare_digest(x_admin_token or "", token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+# API to list the sentiment model versions and which one is active / shadowed in this worker
+@app.get("/api/v1/admin/models", response_model=dict, dependencies=[Depends(require_admin)])
+def get_models_endpoint():
+    return create_response("success", "Successfully fetched", data=model_registry.status())
+
+
+# API to switch the active sentiment model. The version is loaded before it is swapped in, other
+# workers pick the change up from the registry within MODEL_WATCH_SECONDS
+@app.post("/api/v1/admin/models/activate", response_model=dict, dependencies=[Depends(require_admin)])
+def activate_model_endpoint(version: str = Form(...)):
+    try:
+        model_registry.activate(version)
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not load model version {version}: {str(e)}")
+    return create_response("success", f"Model version {version} activated", data=model_registry.status())
+
+
+# API to score a sample of texts with a candidate model as well (shadow mode), an empty version stops it
+@app.post("/api/v1/admin/models/shadow", response_model=dict, dependencies=[Depends(require_admin)])
+def shadow_model_endpoint(version: Optional[str] = Form(None), sample_rate: float = Form(0.1)):
+    try:
+        model_registry.set_shadow(version, sample_rate=sample_rate)
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not load model version {version}: {str(e)}")
+    return create_response("success", "Shadow model updated", data=model_registry.status())
+
+
+# API to re-read the model registry now instead of waiting for the next check
+@app.post("/api/v1/admin/models/reload", response_model=dict, dependencies=[Depends(require_admin)])
+def reload_models_endpoint():
+    model_registry.apply_state()
+    return create_response("success", "Model registry reloaded", data=model_registry.status())
@@ -0,0 +1,175 @@
+# metrics.py
+# Prometheus metrics for the API: request latency per route template, SQL statement counts and
+# durations per request, sentiment pipeline stage timings, S3 upload and model load durations, model
+# reloads, shadow model agreement and admission control (rejections, queue time, in-flight requests).
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+from sqlalchemy import event
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["method", "route", "status"],
+)
+
+DB_STATEMENTS_PER_REQUEST = Histogram(
+    "db_statements_per_request",
+    "Number of SQL statements issued while serving one request",
+    ["route"],
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Total time spent in SQL statements while serving one request",
+    ["route"],
+)
+
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds",
+    "Duration of individual SQL statements by operation",
+    ["operation"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+SENTIMENT_STAGE_DURATION = Histogram(
+    "sentiment_stage_duration_seconds",
+    "Duration of sentiment pipeline stages",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+MODEL_LOAD_DURATION = Histogram(
+    "sentiment_model_load_seconds",
+    "Time to load the sentiment model, stopwords and vocabulary",
+)
+
+MODEL_RELOADS = Counter(
+    "sentiment_model_reloads_total",
+    "Sentiment model registry reloads by outcome",
+    ["outcome"],
+)
+
+SHADOW_PREDICTIONS = Counter(
+    "sentiment_shadow_predictions_total",
+    "Texts scored by both the active and the shadow model, by whether their labels agree",
+    ["active_version", "shadow_version", "outcome"],
+)
+
+SHADOW_PREDICT_DURATION = Histogram(
+    "sentiment_shadow_predict_seconds",
+    "Vectorize and predict time of the active and the shadow model on the same sampled texts",
+    ["model", "version"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+ADMISSION_REJECTIONS = Counter(
+    "admission_rejections_total",
+    "Requests turned away by admission control, by route class and reason",
+    ["route_class", "reason"],
+)
+
+ADMISSION_QUEUE_TIME = Histogram(
+    "admission_queue_seconds",
+    "Time admitted requests waited for a concurrency slot, by route class",
+    ["route_class"],
+    buckets=(0, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+ADMISSION_REQUESTS = Gauge(
+    "admission_requests",
+    "Requests holding (running) or waiting for (queued) a concurrency slot, by route class",
+    ["route_class", "state"],
+    multiprocess_mode="livesum",
+)
+
+S3_UPLOAD_DURATION = Histogram(
+    "s3_upload_duration_seconds",
+    "Duration of S3 uploads by outcome",
+    ["outcome"],
+)
+
+
+class RequestStats:
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+
+
+# Stats of the request currently being served, set by the metrics middleware
+current_request_stats: ContextVar = ContextVar("current_request_stats", default=None)
+
+
+# Context manager that observes the elapsed time of the block on a histogram
+@contextmanager
+def timed(histogram, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        (histogram.labels(**labels) if labels else histogram).observe(elapsed)
+
+
+# Function to attach statement timing listeners to a SQLAlchemy engine
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_STATEMENT_DURATION.labels(operation=operation).observe(elapsed)
+
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_seconds += elapsed
+
+
+# Function to resolve the route template (e.g. /api/v1/users/{user_id}) of a served request. Requests
+# admission control refused before routing are labelled by route class (e.g. "admission:inference")
+def route_template(request):
+    route = request.scope.get("route")
+    if getattr(route, "path", None):
+        return route.path
+    route_class = request.scope.get("admission_route_class")
+    return f"admission:{route_class}" if route_class else "unmatched"
+
+
+# Function to add the request metrics middleware to a FastAPI app
+def install_middleware(app):
+    @app.middleware("http")
+    async def metrics_middleware(request, call_next):
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            current_request_stats.reset(token)
+            route = route_template(request)
+            REQUEST_LATENCY.labels(method=request.method, route=route, status=str(status)).observe(elapsed)
+            DB_STATEMENTS_PER_REQUEST.labels(route=route).observe(stats.statements)
+            DB_TIME_PER_REQUEST.labels(route=route).observe(stats.db_seconds)
+
+
+# Function to render the current metrics in the Prometheus text format. Under the pre-fork server
+# (PROMETHEUS_MULTIPROC_DIR set) every worker writes its samples to that directory and any worker
+# can serve the aggregate
+def render_latest():
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,71 @@
+# migrations.py
+# Explicit schema creation/upgrade step. Runs at application startup (disable with AUTO_MIGRATE=0)
+# or on its own before rolling out workers:
+#
+#   python migrations.py
+import logging
+import os
+import time
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import Session
+
+from database import engine
+import models  # noqa: F401  registers the tables on Base.metadata
+from database import Base
+import place_stats
+
+logger = logging.getLogger("travel_app.migrations")
+
+
+def auto_migrate_enabled():
+    return os.environ.get("AUTO_MIGRATE", "1").lower() not in ("0", "false", "no", "off")
+
+
+# Function to add a column introduced after its table was created, only nullable columns can be
+# added without a default for the existing rows
+def add_column(bind, table, column):
+    if not column.nullable or column.primary_key:
+        raise RuntimeError(f"cannot add non-nullable column {table.name}.{column.name} to an existing table")
+    preparer = bind.dialect.identifier_preparer
+    column_type = column.type.compile(dialect=bind.dialect)
+    with bind.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {preparer.format_table(table)} "
+                          f"ADD COLUMN {preparer.format_column(column)} {column_type}"))
+    logger.info("added column %s.%s", table.name, column.name)
+
+
+# Function to create missing tables, columns and indexes and backfill derived tables created by this run
+def upgrade(bind=engine):
+    started = time.perf_counter()
+    existing = set(inspect(bind).get_table_names())
+    Base.metadata.create_all(bind=bind)
+
+    # create_all skips tables that already exist, including columns and indexes added to them later
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        if table.name in existing:
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present:
+                    add_column(bind, table, column)
+            for index in table.indexes:
+                index.create(bind=bind, checkfirst=True)
+
+    if models.PlaceStats.__tablename__ not in existing:
+        with Session(bind=bind) as db:
+            count = place_stats.rebuild(db)
+            db.commit()
+        logger.info("backfilled place stats places=%d", count)
+
+    if models.PlaceSimilarity.__tablename__ not in existing:
+        from similar_places import similar_places
+
+        with Session(bind=bind) as db:
+            similar_places.build(db)
+    logger.info("schema upgrade done duration_ms=%.1f", (time.perf_counter() - started) * 1000)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+    upgrade()
@@ -0,0 +1,277 @@
+# model_registry.py
+# Versioned sentiment models. Each version is a directory under MODEL_REGISTRY_DIR
+# (static/model/registry by default) holding model.pickle and vocabulary.txt, plus an optional
+# meta.json. registry.json in the same directory names the active version and an optional shadow
+# candidate that scores a sample of texts without affecting responses:
+#
+#   {"active": "20250301-120000", "shadow": "20250310-090000", "shadow_sample_rate": 0.1}
+#
+# Without registry.json (or without "active") the original static/model/model_naive.pickle is
+# served as version "legacy".
+#
+# Every worker checks registry.json at most every MODEL_WATCH_SECONDS while scoring. When it
+# changed, the models are loaded in a background thread and swapped in with one reference
+# assignment: texts already being scored finish with the model they started with, and a version
+# that fails to load leaves the current one serving.
+import json
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+
+from metrics import MODEL_LOAD_DURATION, MODEL_RELOADS
+
+logger = logging.getLogger("travel_app.model_registry")
+
+LEGACY_VERSION = "legacy"
+LEGACY_MODEL_PATH = "static/model/model_naive.pickle"
+LEGACY_VOCABULARY_PATH = "static/model/vocabulary.txt"
+
+STATE_FILE = "registry.json"
+MODEL_FILE = "model.pickle"
+VOCABULARY_FILE = "vocabulary.txt"
+META_FILE = "meta.json"
+
+VERSION_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+
+def registry_dir():
+    return os.environ.get("MODEL_REGISTRY_DIR", "static/model/registry")
+
+
+def watch_seconds():
+    return float(os.environ.get("MODEL_WATCH_SECONDS", "5"))
+
+
+class UnknownModelVersion(Exception):
+    pass
+
+
+def load_vocabulary(path):
+    import pandas as pd
+
+    vocab = pd.read_csv(path, header=None)
+    return vocab[0].tolist()
+
+
+class LoadedModel:
+    def __init__(self, version, model, tokens):
+        self.version = version
+        self.model = model
+        self.tokens = tokens
+
+
+class ModelRegistry:
+    def __init__(self, root=None):
+        self.root = root
+        self.lock = threading.Lock()
+        self.load_lock = threading.Lock()  # one load at a time, later ones reuse what it loaded
+        self.active = None
+        self.shadow = None
+        self.shadow_sample_rate = 0.0
+        self.state_stamp = None
+        self.checked_at = 0.0
+        self.loader = None
+
+    @property
+    def path(self):
+        return self.root or registry_dir()
+
+    def version_dir(self, version):
+        if not VERSION_PATTERN.match(version or "") or version == LEGACY_VERSION:
+            raise UnknownModelVersion(f"Invalid model version {version!r}")
+        return os.path.join(self.path, version)
+
+    def _state_stamp(self):
+        try:
+            stat = os.stat(os.path.join(self.path, STATE_FILE))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def read_state(self):
+        try:
+            with open(os.path.join(self.path, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    # Function to update registry.json atomically, so watchers never read a half written file
+    def write_state(self, **changes):
+        state = {**self.read_state(), **changes}
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".registry-", suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, os.path.join(self.path, STATE_FILE))
+        return state
+
+    # Function to list the versions in the registry with their metadata, oldest first
+    def versions(self):
+        if not os.path.isdir(self.path):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.path)):
+            directory = os.path.join(self.path, name)
+            if not VERSION_PATTERN.match(name) or not os.path.isfile(os.path.join(directory, MODEL_FILE)):
+                continue
+            meta = {}
+            if os.path.isfile(os.path.join(directory, META_FILE)):
+                with open(os.path.join(directory, META_FILE)) as f:
+                    meta = json.load(f)
+            result.append({"version": name, **meta})
+        return result
+
+    def read_meta(self, version):
+        if version == LEGACY_VERSION:
+            return {}
+        try:
+            with open(os.path.join(self.version_dir(version), META_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    # Function to add a new version. It is written to a temporary directory and renamed into place,
+    # so it never appears in the registry half written. Returns the version name
+    def publish(self, model, tokens, meta, version=None):
+        version = version or time.strftime("%Y%m%d-%H%M%S", time.gmtime())
+        base = version
+        suffix = 1
+        while os.path.exists(os.path.join(self.path, version)):
+            suffix += 1
+            version = f"{base}.{suffix}"
+        directory = self.version_dir(version)
+        os.makedirs(self.path, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=self.path, prefix=f".{version}-")
+        os.chmod(tmp, 0o755)
+        with open(os.path.join(tmp, MODEL_FILE), "wb") as f:
+            pickle.dump(model, f)
+        with open(os.path.join(tmp, VOCABULARY_FILE), "w", encoding="utf-8") as f:
+            f.write("\n".join(tokens))
+        with open(os.path.join(tmp, META_FILE), "w") as f:
+            json.dump({"version": version, **meta}, f, indent=2, sort_keys=True, default=str)
+        os.rename(tmp, directory)
+        logger.info("published sentiment model version=%s", version)
+        return version
+
+    @MODEL_LOAD_DURATION.time()
+    def load_version(self, version):
+        if version == LEGACY_VERSION:
+            model_path, vocabulary_path = LEGACY_MODEL_PATH, LEGACY_VOCABULARY_PATH
+        else:
+            directory = self.version_dir(version)
+            model_path = os.path.join(directory, MODEL_FILE)
+            vocabulary_path = os.path.join(directory, VOCABULARY_FILE)
+            if not os.path.isfile(model_path):
+                raise UnknownModelVersion(f"Model version {version!r} is not in the registry")
+        with open(model_path, "rb") as f:
+            model = pickle.load(f)
+        tokens = load_vocabulary(vocabulary_path)
+        logger.info("loaded sentiment model version=%s vocabulary=%d", version, len(tokens))
+        return LoadedModel(version, model, tokens)
+
+    # Function to load whatever registry.json names and swap it in, reusing models already loaded
+    def apply_state(self):
+        with self.load_lock:
+            self._apply_state()
+
+    def _apply_state(self):
+        stamp = self._state_stamp()
+        state = self.read_state() if stamp else {}
+        active_version = state.get("active") or LEGACY_VERSION
+        shadow_version = state.get("shadow")
+
+        current, current_shadow = self.active, self.shadow
+        loaded = {model.version: model for model in (current, current_shadow) if model is not None}
+        try:
+            active = loaded.get(active_version) or self.load_version(active_version)
+        except Exception:
+            MODEL_RELOADS.labels(outcome="error").inc()
+            logger.exception("could not load model version=%s, keeping version=%s", active_version,
+                             current.version if current else None)
+            if current is None and active_version != LEGACY_VERSION:
+                active = self.load_version(LEGACY_VERSION)
+            else:
+                self.state_stamp = stamp  # do not retry a broken artifact on every check
+                return
+        shadow = None
+        if shadow_version and shadow_version != active.version:
+            try:
+                shadow = loaded.get(shadow_version) or self.load_version(shadow_version)
+            except Exception:
+                logger.exception("could not load shadow model version=%s, shadow mode off", shadow_version)
+
+        with self.lock:
+            self.active, self.shadow = active, shadow
+            self.shadow_sample_rate = float(state.get("shadow_sample_rate", 0.1)) if shadow else 0.0
+            self.state_stamp = stamp
+        MODEL_RELOADS.labels(outcome="success").inc()
+        if current is None or current.version != active.version:
+            logger.info("serving sentiment model version=%s shadow=%s", active.version,
+                        shadow.version if shadow else None)
+
+    # Function to reload in a background thread, scoring keeps using the current models meanwhile
+    def reload_in_background(self):
+        with self.lock:
+            if self.loader is not None and self.loader.is_alive():
+                return
+            self.loader = threading.Thread(target=self._reload, name="model-reload", daemon=True)
+            self.loader.start()
+
+    def _reload(self):
+        try:
+            self.apply_state()
+        except Exception:
+            logger.exception("model reload failed")
+
+    # Function to get the active model, loading it on first use and noticing registry changes
+    def current(self):
+        if self.active is None:
+            try:
+                self.apply_state()
+            except Exception:
+                logger.exception("could not load a sentiment model, check the model registry and static/model")
+            return self.active
+
+        now = time.monotonic()
+        interval = watch_seconds()
+        if interval > 0 and now - self.checked_at >= interval:
+            self.checked_at = now
+            if self._state_stamp() != self.state_stamp:
+                self.reload_in_background()
+        return self.active
+
+    # Function to make a version active in every worker, it is loaded (and so validated) here first
+    def activate(self, version):
+        model = self.load_version(version)
+        shadow = self.read_state().get("shadow")
+        self.write_state(active=version, shadow=None if shadow == version else shadow)
+        with self.lock:
+            self.active = model
+        self.apply_state()
+        return model
+
+    # Function to set (or with version None clear) the shadow candidate in every worker
+    def set_shadow(self, version, sample_rate=0.1):
+        if version:
+            self.load_version(version)  # fail here rather than in every worker
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.write_state(shadow=version or None, shadow_sample_rate=sample_rate)
+        self.apply_state()
+
+    def status(self):
+        active, shadow = self.active, self.shadow
+        return {
+            "active": active.version if active else None,
+            "shadow": shadow.version if shadow else None,
+            "shadow_sample_rate": self.shadow_sample_rate,
+            "versions": self.versions(),
+        }
+
+
+registry = ModelRegistry()
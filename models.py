@@ -1,9 +1,9 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, Text, Float
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, Enum, DateTime, Text, Float, Index
+from sqlalchemy.orm import relationship
 from enum import Enum as PyEnum
 from datetime import datetime, timezone
 
-Base = declarative_base()
+from database import Base
 
 
 class UserRoles(PyEnum):
@@ -41,10 +41,25 @@ class Place(Base):
     positive_count = Column(Integer, default=0) 
     neutral_count = Column(Integer, default=0)
     comments = relationship("Comment", back_populates="place")
+    stats = relationship("PlaceStats", back_populates="place", uselist=False)
+
+    # Denormalized statistics exposed on place responses, see PlaceStats
+    @property
+    def comment_count(self):
+        return self.stats.comment_count if self.stats else 0
+
+    @property
+    def average_static_rating(self):
+        return self.stats.average_static_rating if self.stats else None
 
 
 class Comment(Base):
     __tablename__ = "comments"
+    __table_args__ = (
+        # keyset pagination of a place's / user's comments, newest first
+        Index("ix_comments_place_commented_at_id", "place_id", "commented_at", "id"),
+        Index("ix_comments_user_commented_at_id", "user_id", "commented_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -54,11 +69,44 @@ class Comment(Base):
     email = Column(String)  # extra add field
     name = Column(String)  # extra add field
     label = Column(String)  # sentiment label
+    model_version = Column(String, nullable=True)  # sentiment model version that produced the label
     static_rating = Column(Float, nullable=True)  # New field
     user = relationship("User", back_populates="comments")
     place = relationship("Place", back_populates="comments")
 
 
+class PlaceStats(Base):
+    __tablename__ = "place_stats"
+
+    # Maintained in the same transaction as comment writes, rebuilt by place_stats.py
+    place_id = Column(Integer, ForeignKey("places.id"), primary_key=True)
+    comment_count = Column(Integer, default=0, nullable=False)
+    rated_count = Column(Integer, default=0, nullable=False)  # comments with a static_rating
+    static_rating_sum = Column(Float, default=0.0, nullable=False)
+    positive_count = Column(Integer, default=0, nullable=False)
+    negative_count = Column(Integer, default=0, nullable=False)
+    neutral_count = Column(Integer, default=0, nullable=False)
+    last_commented_at = Column(DateTime, nullable=True)
+    place = relationship("Place", back_populates="stats")
+
+    @property
+    def average_static_rating(self):
+        if not self.rated_count:
+            return None
+        return self.static_rating_sum / self.rated_count
+
+
+class PlaceSimilarity(Base):
+    __tablename__ = "place_similarities"
+    __table_args__ = (Index("ix_place_similarities_place_rank", "place_id", "rank"),)
+
+    # Precomputed top-k nearest neighbours of each place, built by similar_places.py
+    place_id = Column(Integer, ForeignKey("places.id"), primary_key=True)
+    similar_place_id = Column(Integer, ForeignKey("places.id"), primary_key=True)
+    rank = Column(Integer, nullable=False)
+    score = Column(Float, nullable=False)
+
+
 class Category(Base):
     __tablename__ = "categories"
 
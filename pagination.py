@@ -0,0 +1,52 @@
+# pagination.py
+# Opaque keyset cursors. A cursor is the sort key of the last row of a page, base64 encoded, and
+# the next page starts strictly after it, so page cost does not grow with depth like OFFSET does.
+import base64
+import json
+from datetime import datetime
+
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def clamp_limit(limit):
+    return max(min(limit, MAX_PAGE_SIZE), 1)
+
+
+def encode_cursor(*key):
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in key]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+# Function to decode a cursor back into its sort key, one value per type in `types` (datetimes
+# are parsed from their isoformat). Anything else raises InvalidCursor
+def decode_cursor(cursor, types):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+    if not isinstance(values, list) or len(values) != len(types):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    key = []
+    for value, expected in zip(values, types):
+        if expected is datetime and isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError as e:
+                raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+        # bool is an int subclass but never a valid key
+        if not isinstance(value, expected) or isinstance(value, bool):
+            raise InvalidCursor(f"Invalid cursor: {cursor}")
+        key.append(value)
+    return key
+
+
+# Function to split a limit + 1 fetch into the page and the cursor of the next one
+def page_of(rows, limit, key):
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(*key(rows[-1])) if has_more and rows else None
+    return rows, next_cursor
@@ -0,0 +1,141 @@
+# place_stats.py
+# Denormalized per-place statistics (comment count, static rating sum/average, sentiment counts,
+# last comment time). apply_comment keeps a place's row current inside the caller's transaction,
+# rebuild recomputes every row from the comments table in one aggregate pass:
+#
+#   python place_stats.py            # consistency repair, rebuild all rows
+import logging
+import os
+import time
+
+from sqlalchemy import case, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import Comment, Place, PlaceStats
+
+logger = logging.getLogger("travel_app.place_stats")
+
+SENTIMENT_COLUMNS = {
+    "positive": PlaceStats.positive_count,
+    "negative": PlaceStats.negative_count,
+    "neutral": PlaceStats.neutral_count,
+}
+
+
+def _latest_comment_at(place_id):
+    return select(func.max(Comment.commented_at)).where(Comment.place_id == place_id).scalar_subquery()
+
+
+# Function to add (sign=1) or remove (sign=-1) one flushed comment from its place's stats row
+def apply_comment(db: Session, comment: Comment, sign: int = 1):
+    values = {"comment_count": PlaceStats.comment_count + sign}
+    if comment.static_rating is not None:
+        values["rated_count"] = PlaceStats.rated_count + sign
+        values["static_rating_sum"] = PlaceStats.static_rating_sum + sign * comment.static_rating
+    column = SENTIMENT_COLUMNS.get(comment.label)
+    if column is not None:
+        values[column.key] = column + sign
+    if sign > 0:
+        values["last_commented_at"] = case(
+            (or_(PlaceStats.last_commented_at.is_(None), PlaceStats.last_commented_at < comment.commented_at),
+             comment.commented_at),
+            else_=PlaceStats.last_commented_at,
+        )
+    else:
+        values["last_commented_at"] = _latest_comment_at(comment.place_id)
+
+    result = db.execute(
+        update(PlaceStats)
+        .where(PlaceStats.place_id == comment.place_id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        return
+
+    # No row yet (place created before stats existed), derive it from the comments table
+    rebuild(db, place_ids=[comment.place_id])
+
+
+# Function to fetch stats rows for a list of places in one query, keyed by place id
+def get_stats_by_place_ids(db: Session, place_ids):
+    if not place_ids:
+        return {}
+    rows = db.query(PlaceStats).filter(PlaceStats.place_id.in_(list(place_ids))).all()
+    return {row.place_id: row for row in rows}
+
+
+# Function to render the stats fields of a place response, zeros when the place has no row yet
+def stats_fields(stats):
+    return {
+        "comment_count": stats.comment_count if stats else 0,
+        "average_static_rating": stats.average_static_rating if stats else None,
+        "last_commented_at": stats.last_commented_at if stats else None,
+    }
+
+
+# Function to recompute stats from comments with a single GROUP BY, for all places or a subset
+def rebuild(db: Session, place_ids=None):
+    query = (
+        select(
+            Place.id.label("place_id"),
+            func.count(Comment.id).label("comment_count"),
+            func.count(Comment.static_rating).label("rated_count"),
+            func.coalesce(func.sum(Comment.static_rating), 0.0).label("static_rating_sum"),
+            func.coalesce(func.sum(case((Comment.label == "positive", 1), else_=0)), 0).label("positive_count"),
+            func.coalesce(func.sum(case((Comment.label == "negative", 1), else_=0)), 0).label("negative_count"),
+            func.coalesce(func.sum(case((Comment.label == "neutral", 1), else_=0)), 0).label("neutral_count"),
+            func.max(Comment.commented_at).label("last_commented_at"),
+        )
+        .select_from(Place)
+        .outerjoin(Comment, Comment.place_id == Place.id)
+        .group_by(Place.id)
+    )
+    if place_ids is not None:
+        query = query.where(Place.id.in_(list(place_ids)))
+        rows = [dict(row._mapping) for row in db.execute(query)]
+        if rows:
+            upsert(db, rows)
+        return len(rows)
+
+    rows = [dict(row._mapping) for row in db.execute(query)]
+    db.execute(delete(PlaceStats).execution_options(synchronize_session=False))
+    if rows:
+        db.execute(insert(PlaceStats), rows)
+    return len(rows)
+
+
+# Function to insert or overwrite stats rows. Two transactions filling the same missing row do not
+# collide on the primary key as a DELETE + INSERT would
+def upsert(db: Session, rows):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        # no portable upsert, replace the rows
+        db.execute(delete(PlaceStats).where(PlaceStats.place_id.in_([row["place_id"] for row in rows]))
+                   .execution_options(synchronize_session=False))
+        db.execute(insert(PlaceStats), rows)
+        return
+    statement = dialect_insert(PlaceStats)
+    statement = statement.on_conflict_do_update(
+        index_elements=[PlaceStats.place_id],
+        set_={column: statement.excluded[column] for column in rows[0] if column != "place_id"},
+    )
+    db.execute(statement, rows)
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        count = rebuild(db)
+        db.commit()
+        logger.info("rebuilt place stats places=%d duration_ms=%.1f", count, (time.perf_counter() - started) * 1000)
+    finally:
+        db.close()
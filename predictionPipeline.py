@@ -1,44 +1,78 @@
-import numpy as np
-import pandas as pd
+import logging
+import os
+import random
 import re
 import string
-import pickle
-from nltk.stem import PorterStemmer
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+# numpy, pandas and nltk are imported inside the functions that use them so that importing this
+# module (and therefore main) stays cheap for workers that never score text
+
+from metrics import SENTIMENT_STAGE_DURATION, SHADOW_PREDICT_DURATION, SHADOW_PREDICTIONS, timed
+from model_registry import registry
+
+logger = logging.getLogger("travel_app.prediction")
 
 def remove_punctuations(text):
     for punctuation in string.punctuation:
         text = text.replace(punctuation, '')
     return text
 
-def load_model_and_resources():
-    try:
-        with open('static/model/model_naive.pickle','rb') as f:
-            model = pickle.load(f)
-        
-        with open('static/model/corpora/stopwords/english','r') as file:
-            sw = file.read().splitlines()
-        
-        vocab = pd.read_csv('static/model/vocabulary.txt',header=None)
-        tokens = vocab[0].tolist()
-        
-        return model, sw, tokens
-    except FileNotFoundError as e:
-        print(f"Error loading resources: {e}")
-        print("Please check if all required files exist in the static/model directory")
+# Function to get the active model, stopwords and vocabulary. Models are loaded once per process by
+# the registry and hot-swapped when the registry's active version changes, see model_registry.py
+def get_model_and_resources():
+    current = registry.current()
+    if current is None:
         return None, None, None
+    return current.model, get_stopwords(), current.tokens
+
+# Function to load everything scoring needs up front, e.g. in a pre-fork master
+def preload():
+    import numpy  # noqa: F401
+    import pandas  # noqa: F401
+
+    get_stemmer()
+    return all(get_model_and_resources())
+
+@lru_cache(maxsize=None)
+def get_stemmer():
+    from nltk.stem import PorterStemmer
+    return PorterStemmer()
+
+# Stemming dominates cleaning and texts reuse a small set of words, so stems are memoized
+@lru_cache(maxsize=65536)
+def stem(word):
+    return get_stemmer().stem(word)
+
+def load_stopwords():
+    with open('static/model/corpora/stopwords/english','r') as file:
+        return file.read().splitlines()
+
+@lru_cache(maxsize=None)
+def get_stopwords():
+    return frozenset(load_stopwords())
+
+# Function to clean one text: lowercase, drop urls, punctuation, digits and stopwords, then stem
+def clean_text(text, sw):
+    stopwords = sw if isinstance(sw, (set, frozenset)) else set(sw)
+    text = " ".join(x.lower() for x in text.split())
+    text = " ".join(re.sub(r'^https?:\/\/.*[\r\n]*','',x,flags=re.MULTILINE) for x in text.split())
+    text = remove_punctuations(text)
+    text = re.sub(r'\d+','',text)
+    text = " ".join(x for x in text.split() if x not in stopwords)
+    return " ".join(stem(x) for x in text.split())
 
 def preprocessing(text, sw):
-    data = pd.DataFrame([text], columns=['tweet'])
-    data["tweet"] = data["tweet"].apply(lambda x: " ".join(x.lower() for x in x.split()))
-    data["tweet"] = data["tweet"].apply(lambda x: " ".join(re.sub(r'^https?:\/\/.*[\r\n]*','',x,flags=re.MULTILINE) for x in x.split()))
-    data["tweet"] = data["tweet"].apply(remove_punctuations)
-    data["tweet"] = data["tweet"].str.replace('\d+','',regex=True)
-    data["tweet"] = data["tweet"].apply(lambda x: " ".join(x for x in x.split() if x not in sw))
-    ps = PorterStemmer()
-    data["tweet"] = data["tweet"].apply(lambda x: " ".join(ps.stem(x) for x in x.split()))
-    return data['tweet']
+    import pandas as pd
+
+    return pd.Series([clean_text(text, sw)], name='tweet')
 
 def vectorizer(ds, vocabulary):
+    import numpy as np
+
     vectorized_lst = []
     for sentence in ds:
         sentence_lst = np.zeros(len(vocabulary))
@@ -49,8 +83,38 @@ def vectorizer(ds, vocabulary):
     vectorized_lst_new = np.asarray(vectorized_lst, dtype=np.float32)
     return vectorized_lst_new
 
-def get_prediction(vectorized_text, model):
-    prediction = model.predict(vectorized_text)
+# Function to build the same 0/1 features as vectorizer for many texts, with a token -> column lookup
+def vectorize_batch(texts, vocabulary):
+    import numpy as np
+
+    columns = {}
+    for i, token in enumerate(vocabulary):
+        columns.setdefault(token, []).append(i)
+    matrix = np.zeros((len(texts), len(vocabulary)), dtype=np.float32)
+    for row, sentence in enumerate(texts):
+        for token in set(sentence.split()):
+            for col in columns.get(token, ()):
+                matrix[row, col] = 1
+    return matrix
+
+# Function to build the vectorize_batch features as a sparse CSR matrix, e.g. for training on many texts
+def vectorize_sparse(texts, vocabulary):
+    import numpy as np
+    import scipy.sparse as sp
+
+    columns = {}
+    for i, token in enumerate(vocabulary):
+        columns.setdefault(token, []).append(i)
+    indptr = [0]
+    indices = []
+    for sentence in texts:
+        indices.extend(sorted({col for token in set(sentence.split()) for col in columns.get(token, ())}))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    return sp.csr_matrix((data, np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+                         shape=(len(texts), len(vocabulary)))
+
+def label_for(prediction):
     if prediction == 0:
         return 'negative'
     if prediction == 1:
@@ -58,15 +122,101 @@ def get_prediction(vectorized_text, model):
     else:
         return 'positive'
 
+def get_prediction(vectorized_text, model):
+    prediction = model.predict(vectorized_text)
+    return label_for(prediction)
+
+# Function to score one text, returns the label and the version of the model that produced it
+def score_text(text):
+    current = registry.current()
+    if current is None:
+        return "Error: Could not load required resources", None
+    sw = get_stopwords()
+
+    with timed(SENTIMENT_STAGE_DURATION, stage="preprocessing"):
+        preprocessed_txt = preprocessing(text, sw)
+    with timed(SENTIMENT_STAGE_DURATION, stage="vectorize"):
+        vectorized_txt = vectorizer(preprocessed_txt, current.tokens)
+    with timed(SENTIMENT_STAGE_DURATION, stage="predict"):
+        prediction = get_prediction(vectorized_txt, current.model)
+    maybe_shadow(current, list(preprocessed_txt), [prediction])
+    return prediction, current.version
+
 def analyze_text(text):
-    model, sw, tokens = load_model_and_resources()
-    if not all([model, sw, tokens]):
-        return "Error: Could not load required resources"
-    
-    preprocessed_txt = preprocessing(text, sw)
-    vectorized_txt = vectorizer(preprocessed_txt, tokens)
-    prediction = get_prediction(vectorized_txt, model)
-    return prediction
+    return score_text(text)[0]
+
+# Function to score many texts with one model and a single vectorized predict call per batch,
+# returns the labels and the model version
+def score_texts(texts, batch_size=1000):
+    current = registry.current()
+    if current is None:
+        return ["Error: Could not load required resources"] * len(texts), None
+
+    sw = get_stopwords()
+    labels = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        with timed(SENTIMENT_STAGE_DURATION, stage="preprocessing"):
+            cleaned = [clean_text(text, sw) for text in batch]
+        with timed(SENTIMENT_STAGE_DURATION, stage="vectorize"):
+            matrix = vectorize_batch(cleaned, current.tokens)
+        with timed(SENTIMENT_STAGE_DURATION, stage="predict"):
+            batch_labels = [label_for(prediction) for prediction in current.model.predict(matrix)]
+        maybe_shadow(current, cleaned, batch_labels)
+        labels.extend(batch_labels)
+    return labels, current.version
+
+def analyze_texts(texts, batch_size=1000):
+    return score_texts(texts, batch_size=batch_size)[0]
+
+# Shadow mode: a sample of scored texts is also scored by the registry's shadow model on a
+# background thread, recording label agreement and both models' latency, without
+# delaying or changing the response. Samples are dropped while SHADOW_MAX_PENDING are queued
+SHADOW_MAX_PENDING = int(os.environ.get("SHADOW_MAX_PENDING", "100"))
+
+_shadow_executor = None
+_shadow_pid = None
+_shadow_pending = 0
+_shadow_lock = threading.Lock()
+
+def maybe_shadow(current, cleaned, labels):
+    global _shadow_executor, _shadow_pid, _shadow_pending
+    shadow, rate = registry.shadow, registry.shadow_sample_rate
+    if shadow is None or random.random() >= rate:
+        return
+    with _shadow_lock:
+        if _shadow_pending >= SHADOW_MAX_PENDING:
+            return
+        if _shadow_pid != os.getpid():
+            # a forked worker does not inherit the executor's thread
+            _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sentiment-shadow")
+            _shadow_pid = os.getpid()
+        _shadow_pending += 1
+    _shadow_executor.submit(_score_shadow, current, shadow, cleaned, labels)
+
+def _timed_predict(role, model, cleaned):
+    started = time.perf_counter()
+    predictions = model.model.predict(vectorize_batch(cleaned, model.tokens))
+    SHADOW_PREDICT_DURATION.labels(model=role, version=model.version).observe(time.perf_counter() - started)
+    return predictions
+
+def _score_shadow(current, shadow, cleaned, labels):
+    global _shadow_pending
+    try:
+        # the active model is timed again on the same path so the two latencies are comparable
+        _timed_predict("active", current, cleaned)
+        predictions = _timed_predict("shadow", shadow, cleaned)
+        for label, prediction in zip(labels, predictions):
+            outcome = "agree" if label == label_for(prediction) else "disagree"
+            SHADOW_PREDICTIONS.labels(active_version=current.version, shadow_version=shadow.version,
+                                      outcome=outcome).inc()
+    except Exception:
+        SHADOW_PREDICTIONS.labels(active_version=current.version, shadow_version=shadow.version,
+                                  outcome="error").inc(len(labels))
+        logger.exception("shadow scoring failed version=%s", shadow.version)
+    finally:
+        with _shadow_lock:
+            _shadow_pending -= 1
 
 if __name__ == "__main__":
     # Test the pipeline
@@ -0,0 +1,156 @@
+# ranking.py
+# In-memory "top places" index. Places are ranked on the Wilson lower bound of their sentiment
+# counts blended with the average static rating, and kept in sorted lists (overall and per tag) so
+# a top-k read is a slice and a new comment only moves one entry instead of re-sorting the table.
+#
+# Every worker keeps its own index: it is updated from this worker's writes and fully reloaded
+# every RANKING_REFRESH_SECONDS to pick up writes served by other workers.
+import bisect
+import math
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from models import Place, PlaceStats
+
+# z for a 95% confidence interval
+WILSON_Z = 1.96
+MAX_STATIC_RATING = 5.0
+
+
+def sentiment_weight():
+    return float(os.environ.get("RANKING_SENTIMENT_WEIGHT", "0.7"))
+
+
+def refresh_seconds():
+    return float(os.environ.get("RANKING_REFRESH_SECONDS", "300"))
+
+
+# Lower bound of the Wilson score interval for `positive` successes out of `total` trials
+def wilson_lower_bound(positive, total, z=WILSON_Z):
+    if total <= 0:
+        return 0.0
+    phat = positive / total
+    z2 = z * z
+    centre = phat + z2 / (2 * total)
+    margin = z * math.sqrt((phat * (1 - phat) + z2 / (4 * total)) / total)
+    return (centre - margin) / (1 + z2 / total)
+
+
+# Function to score a place, neutral comments count as half a positive vote
+def score_place(positive, negative, neutral, average_static_rating):
+    total = positive + negative + neutral
+    wilson = wilson_lower_bound(positive + 0.5 * neutral, total)
+    if average_static_rating is None:
+        return wilson, wilson
+    weight = sentiment_weight()
+    static = min(max(average_static_rating / MAX_STATIC_RATING, 0.0), 1.0)
+    return weight * wilson + (1 - weight) * static, wilson
+
+
+def _tags(place):
+    return [tag.strip().lower() for tag in (place.tags or "").split(",") if tag.strip()]
+
+
+def _entry(place, stats):
+    positive = stats.positive_count if stats else 0
+    negative = stats.negative_count if stats else 0
+    neutral = stats.neutral_count if stats else 0
+    average = stats.average_static_rating if stats else None
+    score, wilson = score_place(positive, negative, neutral, average)
+    return {
+        "id": place.id,
+        "img": place.img,
+        "title": place.title,
+        "tags": place.tags.split(',') if place.tags else [],
+        "user_id": place.user_id,
+        "user_full_name": place.user_full_name,
+        "rating_score": place.rating_score,
+        "posted_date": place.posted_date,
+        "comment_count": stats.comment_count if stats else 0,
+        "average_static_rating": average,
+        "positive_sentiment_count": positive,
+        "negative_sentiment_count": negative,
+        "neutral_sentiment_count": neutral,
+        "wilson_lower_bound": wilson,
+        "score": score,
+    }
+
+
+class TopPlacesIndex:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.entries = {}  # place_id -> (sort key, tags, entry)
+        self.ranked = []  # sort keys (-score, place_id), best first
+        self.ranked_by_tag = {}  # tag -> sort keys
+
+    def _insert(self, key, tags):
+        bisect.insort(self.ranked, key)
+        for tag in tags:
+            bisect.insort(self.ranked_by_tag.setdefault(tag, []), key)
+
+    def _remove(self, key, tags):
+        del self.ranked[bisect.bisect_left(self.ranked, key)]
+        for tag in tags:
+            keys = self.ranked_by_tag[tag]
+            del keys[bisect.bisect_left(keys, key)]
+            if not keys:
+                del self.ranked_by_tag[tag]
+
+    def _put(self, place, stats):
+        previous = self.entries.pop(place.id, None)
+        if previous:
+            self._remove(previous[0], previous[1])
+        entry = _entry(place, stats)
+        key = (-entry["score"], place.id)
+        tags = _tags(place)
+        self.entries[place.id] = (key, tags, entry)
+        self._insert(key, tags)
+
+    # Function to (re)build the whole index from places and their stats rows in one query
+    def load(self, db: Session):
+        rows = db.query(Place, PlaceStats).outerjoin(PlaceStats, PlaceStats.place_id == Place.id).all()
+        with self.lock:
+            self.entries, self.ranked, self.ranked_by_tag = {}, [], {}
+            for place, stats in rows:
+                self._put(place, stats)
+            self.loaded_at = time.monotonic()
+
+    # Function to force a full reload on the next read, e.g. after a bulk import
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def is_stale(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > refresh_seconds()
+
+    # Function to re-score one place after its comments or stats changed
+    def refresh_place(self, db: Session, place_id: int):
+        if self.loaded_at is None:
+            return  # the first read loads everything anyway
+        row = (
+            db.query(Place, PlaceStats)
+            .outerjoin(PlaceStats, PlaceStats.place_id == Place.id)
+            .filter(Place.id == place_id)
+            .first()
+        )
+        with self.lock:
+            if row is None:
+                previous = self.entries.pop(place_id, None)
+                if previous:
+                    self._remove(previous[0], previous[1])
+            else:
+                self._put(*row)
+
+    def top(self, db: Session, limit: int = 10, tag: str = None):
+        if self.is_stale():
+            self.load(db)
+        with self.lock:
+            keys = self.ranked if tag is None else self.ranked_by_tag.get(tag.strip().lower(), [])
+            return [self.entries[place_id][2] for _, place_id in keys[:limit]]
+
+
+top_places = TopPlacesIndex()
@@ -46,6 +46,8 @@ class PlaceResponse(BaseModel):
     user_full_name: str
     rating_score: float
     posted_date: datetime
+    comment_count: int = 0
+    average_static_rating: Optional[float] = None
 
     class Config:
         orm_mode = True
@@ -71,6 +73,18 @@ class CommentCreate(CommentBase):
     user_id: int
 
 
+# bulk import schemas, one NDJSON line each
+class BulkPlace(PlaceBase):
+    img: str  # already hosted image url, bulk import does not upload
+    ref: Optional[str] = None  # lets comments in the same import refer to this place
+
+
+class BulkComment(CommentBase):
+    user_id: int
+    place_id: Optional[int] = None
+    place_ref: Optional[str] = None
+
+
 class CommentByUserIdResponse(BaseModel):
     comment_id: int
     comment_text: str
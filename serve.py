@@ -0,0 +1,289 @@
+# serve.py
+# Pre-fork production server (POSIX only). The master imports the app, runs the schema migration
+# and loads the sentiment model, stopwords, stemmer, numpy/pandas/sklearn once, freezes the heap
+# and then forks the workers, so those pages are shared copy-on-write instead of every worker
+# loading its own copy. Each worker runs a warm-up request before it starts accepting on the
+# shared socket, and is recycled after WORKER_MAX_REQUESTS (+ jitter) requests.
+#
+#   python serve.py --host 0.0.0.0 --port 8000            # one worker per core
+#   WEB_CONCURRENCY=4 python serve.py
+#
+# Signals to the master: TERM/INT graceful shutdown, HUP rolling restart of all workers. The restart
+# replaces one worker at a time and stops the old one only once its replacement reported it is
+# warmed up, so it never runs with fewer than the configured workers.
+import argparse
+import gc
+import logging
+import os
+import random
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import time
+
+logger = logging.getLogger("travel_app.serve")
+
+# A worker that exits sooner than this after its start is considered crashing, respawns back off
+MIN_WORKER_LIFETIME = 2.0
+
+
+def default_workers():
+    return int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1))
+
+
+# Function to point prometheus_client at a per-run directory, returns it when it is ours to delete
+def setup_metrics_dir():
+    # prometheus_client reads this at import time, so it must be set before the app is imported
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if not path:
+        path = tempfile.mkdtemp(prefix="travel-metrics-")
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = path
+        return path
+    # samples left by a previous run would be merged into this one
+    for name in os.listdir(path):
+        if name.endswith(".db"):
+            os.remove(os.path.join(path, name))
+    return None
+
+
+def preload_app():
+    import main
+    import migrations
+    import predictionPipeline
+    from database import engine
+
+    started = time.perf_counter()
+    migrations.upgrade(engine)
+    # workers must not run the migration again from the startup handler
+    os.environ["AUTO_MIGRATE"] = "0"
+    if not predictionPipeline.preload():
+        logger.warning("sentiment model could not be preloaded, workers will retry on first use")
+    import sklearn  # noqa: F401  unpickling the model imports it, keep it shared even if loading failed
+    engine.dispose()
+    logger.info("preloaded app and model duration_ms=%.1f", (time.perf_counter() - started) * 1000)
+    return main.app
+
+
+def bind_socket(host, port, backlog):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+# Function to push one in-process request through the app (db, ranking index) and score a text
+def warm_up(app):
+    import asyncio
+
+    import httpx
+
+    import predictionPipeline
+
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://warmup") as client:
+            return await client.get("/api/v1/places/top", params={"limit": 1})
+
+    started = time.perf_counter()
+    try:
+        status = asyncio.run(request()).status_code
+        predictionPipeline.analyze_text("warm up request")
+    except Exception:
+        logger.exception("warm-up failed, serving anyway")
+        return
+    logger.info("worker warmed up pid=%d status=%d duration_ms=%.1f",
+                os.getpid(), status, (time.perf_counter() - started) * 1000)
+
+
+def run_worker(app, sock, args, ready_fd):
+    import uvicorn
+
+    from database import engine
+
+    for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)
+    random.seed()
+    # connections inherited from the master must not be shared between processes
+    engine.dispose(close=False)
+
+    warm_up(app)
+    # tell the master, a rolling restart waits for this before stopping the worker this one replaces
+    os.write(ready_fd, b"%d\n" % os.getpid())
+    os.close(ready_fd)
+
+    max_requests = args.max_requests + random.randint(0, args.max_requests_jitter) if args.max_requests else None
+    config = uvicorn.Config(
+        app,
+        log_level=args.log_level.lower(),
+        limit_max_requests=max_requests,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Master:
+    def __init__(self, app, sock, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers = {}  # pid -> started at
+        self.stopping = False
+        self.to_recycle = []
+        self.recycling = None  # old worker waiting for its replacement to warm up
+        self.replacement = None
+        self.retiring = None  # old worker stopped, until it exited
+        # workers write their pid here once warmed up, short writes to a pipe are atomic
+        self.ready_r, self.ready_w = os.pipe()
+        os.set_blocking(self.ready_r, False)
+        self.ready_buffer = b""
+        self.ready = set()
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(self.ready_r)
+                run_worker(self.app, self.sock, self.args, self.ready_w)
+            except BaseException:
+                logger.exception("worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+        logger.info("spawned worker pid=%d", pid)
+        return pid
+
+    # Function to collect the pids of workers that reported they are warmed up
+    def read_ready(self):
+        while True:
+            try:
+                data = os.read(self.ready_r, 4096)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            *lines, self.ready_buffer = (self.ready_buffer + data).split(b"\n")
+            self.ready.update(int(line) for line in lines if line)
+
+    def kill_all(self, signum):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def on_stop(self, signum, frame):
+        self.stopping = True
+        self.kill_all(signal.SIGTERM)
+
+    def on_reload(self, signum, frame):
+        logger.info("rolling restart of %d workers", len(self.workers))
+        self.to_recycle = list(self.workers)
+
+    def reap(self):
+        from prometheus_client import multiprocess
+
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            self.ready.discard(pid)
+            multiprocess.mark_process_dead(pid)
+            if pid == self.retiring:
+                self.retiring = None
+            if started is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            logger.info("worker exited pid=%d code=%d", pid, code)
+            if not self.stopping and time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(1)  # crashing on boot, do not spin
+
+    # Function to advance a rolling restart: spawn a replacement for one old worker at a time, and
+    # stop the old worker only once the replacement is warmed up and accepting
+    def roll(self):
+        self.read_ready()
+        if self.recycling is None and self.retiring is None and self.to_recycle:
+            pid = self.to_recycle.pop(0)
+            if pid in self.workers:
+                self.recycling = pid
+        if self.recycling is None:
+            return
+        if self.recycling not in self.workers:
+            # exited on its own meanwhile, the replacement simply takes its place
+            self.recycling = self.replacement = None
+        elif self.replacement not in self.workers:
+            self.replacement = self.spawn()  # also when a previous replacement died while booting
+        elif self.replacement in self.ready:
+            logger.info("retiring worker pid=%d, replaced by pid=%d", self.recycling, self.replacement)
+            try:
+                os.kill(self.recycling, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+            self.retiring, self.recycling, self.replacement = self.recycling, None, None
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.on_stop)
+        signal.signal(signal.SIGINT, self.on_stop)
+        signal.signal(signal.SIGHUP, self.on_reload)
+
+        # objects loaded so far are never freed, keep the collector from touching (and copying) them
+        gc.collect()
+        gc.freeze()
+
+        deadline = None
+        while True:
+            self.reap()
+            if self.stopping:
+                if not self.workers:
+                    break
+                deadline = deadline or time.monotonic() + self.args.graceful_timeout + 5
+                if time.monotonic() > deadline:
+                    self.kill_all(signal.SIGKILL)
+            else:
+                while len(self.workers) < self.args.workers:
+                    self.spawn()
+                self.roll()
+            time.sleep(0.2)
+        logger.info("master stopped")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the API with pre-forked workers sharing a preloaded model")
+    parser.add_argument("--host", default=os.environ.get("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--max-requests", type=int, default=int(os.environ.get("WORKER_MAX_REQUESTS", "10000")),
+                        help="Recycle a worker after this many requests, 0 disables")
+    parser.add_argument("--max-requests-jitter", type=int, default=1000)
+    parser.add_argument("--graceful-timeout", type=int, default=30)
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "INFO"))
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+    owned_metrics_dir = setup_metrics_dir()
+    app = preload_app()
+    sock = bind_socket(args.host, args.port, args.backlog)
+    logger.info("listening on %s:%d with %d workers", args.host, args.port, args.workers)
+    try:
+        Master(app, sock, args).run()
+    finally:
+        sock.close()
+        if owned_metrics_dir:
+            shutil.rmtree(owned_metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+# similar_places.py
+# "Similar places" recommendations. Each place is a TF-IDF vector over its title, tags and content,
+# cleaned and stemmed with the sentiment pipeline's clean_text. The top SIMILAR_PLACES_K nearest
+# neighbours by cosine similarity are precomputed into place_similarities, so a lookup is a
+# k-row indexed read that never writes. New places are added incrementally when they are created,
+# only the lists they enter are rewritten. Words the fitted vocabulary does not know are dropped by
+# an incremental add, so once they make up more than SIMILAR_PLACES_REFIT_UNKNOWN of the catalogue's
+# words, or SIMILAR_PLACES_REFIT_EVERY places were added since the last fit, the add does a full
+# rebuild instead: it refits the vocabulary and idf weights over every place and rewrites the table.
+# Full rebuilds also run when the schema migration creates the table, after bulk imports and from
+# the command line:
+#
+#   python similar_places.py         # full rebuild
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import delete, func, insert
+from sqlalchemy.orm import Session
+
+from models import Place, PlaceSimilarity
+from predictionPipeline import clean_text, load_stopwords
+
+logger = logging.getLogger("travel_app.similar_places")
+
+# Rows of the similarity product computed at once, bounds memory on large catalogues
+CHUNK_ROWS = 1024
+
+
+def top_k():
+    return int(os.environ.get("SIMILAR_PLACES_K", "10"))
+
+
+def refit_unknown_share():
+    return float(os.environ.get("SIMILAR_PLACES_REFIT_UNKNOWN", "0.05"))
+
+
+def refit_every():
+    return int(os.environ.get("SIMILAR_PLACES_REFIT_EVERY", "500"))
+
+
+# Function to build the text of a place, title and tags are short but descriptive so count twice
+def place_document(place, sw):
+    tags = " ".join((place.tags or "").split(","))
+    title = place.title or ""
+    return clean_text(" ".join([title, tags, title, tags, place.content or ""]), sw)
+
+
+# Function to pick the top k neighbours of every row of a sparse similarity block
+def _neighbours(similarity, row_ids, ids, k):
+    import numpy as np
+
+    similarity = similarity.tocsr()
+    result = {}
+    for row, place_id in enumerate(row_ids):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        cols = similarity.indices[start:end]
+        scores = similarity.data[start:end]
+        keep = (ids[cols] != place_id) & (scores > 0)
+        cols, scores = cols[keep], scores[keep]
+        if len(scores) > k:
+            best = np.argpartition(-scores, k)[:k]
+            cols, scores = cols[best], scores[best]
+        order = np.argsort(-scores, kind="stable")
+        result[int(place_id)] = [(int(ids[col]), float(score)) for col, score in zip(cols[order], scores[order])]
+    return result
+
+
+def _rows(neighbours):
+    return [
+        {"place_id": place_id, "similar_place_id": similar_id, "rank": rank, "score": score}
+        for place_id, similar in neighbours.items()
+        for rank, (similar_id, score) in enumerate(similar)
+    ]
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.vectorizer = None
+        self.matrix = None  # L2 normalized tf-idf rows, aligned with ids
+        self.ids = None
+        self.rows = {}  # place_id -> row of matrix
+        self.words = 0  # words of every place in matrix, the fitted ones and the added ones
+        self.unknown_words = 0  # words of added places the vocabulary did not know
+        self.added = 0  # places added since the last fit
+
+    @property
+    def loaded(self):
+        return self.vectorizer is not None
+
+    def _write(self, db: Session, neighbours, replace_all=False):
+        clear = delete(PlaceSimilarity)
+        if not replace_all:
+            clear = clear.where(PlaceSimilarity.place_id.in_(list(neighbours)))
+        db.execute(clear.execution_options(synchronize_session=False))
+        rows = _rows(neighbours)
+        if rows:
+            db.execute(insert(PlaceSimilarity), rows)
+        db.commit()
+
+    # Function to fit tf-idf on every place, in memory only
+    def _fit(self, db: Session):
+        import numpy as np
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        sw = set(load_stopwords())
+        places = db.query(Place.id, Place.title, Place.tags, Place.content).order_by(Place.id).all()
+        documents = [place_document(place, sw) for place in places]
+        ids = np.array([place.id for place in places], dtype=np.int64)
+        vectorizer = TfidfVectorizer(analyzer=str.split, sublinear_tf=True, dtype=np.float32)
+        words = sum(len(document.split()) for document in documents)
+        # no words at all (e.g. only stopwords) leaves nothing to fit, the next add tries again
+        matrix = vectorizer.fit_transform(documents).tocsr() if words else None
+        self.vectorizer = vectorizer if words else None
+        self.matrix, self.ids = matrix, ids
+        self.rows = {int(place_id): row for row, place_id in enumerate(ids)}
+        self.words, self.unknown_words, self.added = words, 0, 0
+        return len(places)
+
+    # Function to fit tf-idf on every place and rewrite the whole neighbour table. Run from the
+    # command line, the schema migration and bulk imports, never while serving a lookup
+    def build(self, db: Session):
+        with self.lock:
+            started = time.perf_counter()
+            count = self._fit(db)
+            k = top_k()
+            neighbours = {}
+            for start in range(0, count if self.loaded else 0, CHUNK_ROWS):
+                block = self.matrix[start:start + CHUNK_ROWS] @ self.matrix.T
+                neighbours.update(_neighbours(block, self.ids[start:start + CHUNK_ROWS], self.ids, k))
+
+            self._write(db, neighbours, replace_all=True)
+            logger.info("built similar places index places=%d duration_ms=%.1f",
+                        count, (time.perf_counter() - started) * 1000)
+            return neighbours
+
+    # Function to load the vectorizer and matrix for incremental updates, the table is left as is
+    def load(self, db: Session):
+        with self.lock:
+            started = time.perf_counter()
+            count = self._fit(db)
+            logger.info("loaded similar places vectors places=%d duration_ms=%.1f",
+                        count, (time.perf_counter() - started) * 1000)
+
+    # Function to read the stored neighbour lists of some places
+    def _stored_lists(self, db: Session, place_ids):
+        lists = {}
+        for start in range(0, len(place_ids), 500):
+            rows = (
+                db.query(PlaceSimilarity.place_id, PlaceSimilarity.similar_place_id, PlaceSimilarity.score)
+                .filter(PlaceSimilarity.place_id.in_(place_ids[start:start + 500]))
+                .order_by(PlaceSimilarity.place_id, PlaceSimilarity.rank)
+                .all()
+            )
+            for row in rows:
+                lists.setdefault(row.place_id, []).append((row.similar_place_id, row.score))
+        return lists
+
+    # Function to tell whether the vocabulary went stale enough that a full rebuild is due
+    def _needs_refit(self):
+        return (self.added >= refit_every()
+                or self.unknown_words > refit_unknown_share() * max(self.words, 1))
+
+    # Function to compute one place's neighbours and update only the stored lists it enters, or to
+    # rebuild everything when too many words are missing from the vocabulary. Called on place creation
+    def add_place(self, db: Session, place):
+        import numpy as np
+        import scipy.sparse as sp
+
+        with self.lock:
+            expected = len(self.ids) + (0 if place.id in self.rows else 1) if self.loaded else None
+            if expected is None or db.query(func.count(Place.id)).scalar() != expected:
+                # not loaded yet, or places were added by another worker since
+                self.load(db)
+            if not self.loaded:
+                return []
+
+            if place.id not in self.rows:
+                document = place_document(place, set(load_stopwords())).split()
+                self.words += len(document)
+                self.unknown_words += sum(1 for word in document if word not in self.vectorizer.vocabulary_)
+                self.added += 1
+                if self._needs_refit():
+                    return self.build(db).get(place.id, [])
+                vector = self.vectorizer.transform([" ".join(document)]).tocsr()
+                self.matrix = sp.vstack([self.matrix, vector], format="csr")
+                self.ids = np.append(self.ids, place.id)
+                self.rows[place.id] = len(self.ids) - 1
+            row = self.rows[place.id]
+            scores = np.asarray((self.matrix @ self.matrix[row].T).todense()).ravel()
+            scores[row] = 0
+
+            k = top_k()
+            candidates = np.flatnonzero(scores > 0)
+            stored = self._stored_lists(db, [int(self.ids[col]) for col in candidates])
+            changed = {}
+            for col in candidates:
+                other_id, score = int(self.ids[col]), float(scores[col])
+                current = stored.get(other_id, [])
+                similar = [item for item in current if item[0] != place.id]
+                if len(similar) < k or score > similar[k - 1][1]:
+                    similar.append((place.id, score))
+                    similar.sort(key=lambda item: -item[1])
+                    del similar[k:]
+                if similar != current:
+                    changed[other_id] = similar
+
+            order = np.argsort(-scores, kind="stable")[:k]
+            own = [(int(self.ids[col]), float(scores[col])) for col in order if scores[col] > 0]
+            changed[place.id] = own
+            self._write(db, changed)
+            return own
+
+    # Function to drop the loaded vectors so the next incremental update refits them
+    def invalidate(self):
+        with self.lock:
+            self.vectorizer, self.matrix, self.ids, self.rows = None, None, None, {}
+
+    def _lookup(self, db: Session, place_id: int, limit: int):
+        return (
+            db.query(PlaceSimilarity.score, Place)
+            .join(Place, Place.id == PlaceSimilarity.similar_place_id)
+            .filter(PlaceSimilarity.place_id == place_id)
+            .order_by(PlaceSimilarity.rank)
+            .limit(limit)
+            .all()
+        )
+
+    # Function to read a place's precomputed neighbours, none when it has no stored rows. Lookups
+    # never compute or write, that happens on place creation, bulk imports and full rebuilds
+    def similar(self, db: Session, place_id: int, limit: int = 10):
+        rows = self._lookup(db, place_id, limit)
+        return [
+            {
+                "id": place.id,
+                "img": place.img,
+                "title": place.title,
+                "tags": place.tags.split(',') if place.tags else [],
+                "user_id": place.user_id,
+                "user_full_name": place.user_full_name,
+                "rating_score": place.rating_score,
+                "posted_date": place.posted_date,
+                "similarity": score,
+            }
+            for score, place in rows
+        ]
+
+
+similar_places = SimilarityIndex()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+    db = SessionLocal()
+    try:
+        similar_places.build(db)
+    finally:
+        db.close()
@@ -0,0 +1,143 @@
+# sqlprofiler.py
+# Opt-in SQL profiler (SQL_PROFILE=1). Records every statement issued while serving a request,
+# logs statements slower than SQL_SLOW_QUERY_MS together with their query plan, flags statements
+# repeated SQL_N_PLUS_ONE_THRESHOLD or more times in one request as likely N+1 patterns and adds a
+# per-request summary in the X-SQL-Profile response headers.
+import logging
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from metrics import route_template
+
+logger = logging.getLogger("travel_app.sqlprofiler")
+
+SUMMARY_HEADER = "X-SQL-Profile"
+REPEATED_HEADER = "X-SQL-Profile-Repeated"
+
+
+def is_enabled():
+    return os.environ.get("SQL_PROFILE", "").lower() in ("1", "true", "yes", "on")
+
+
+def slow_query_threshold():
+    return float(os.environ.get("SQL_SLOW_QUERY_MS", "100")) / 1000
+
+
+def n_plus_one_threshold():
+    return int(os.environ.get("SQL_N_PLUS_ONE_THRESHOLD", "5"))
+
+
+# Function to collapse whitespace so a statement fits on one log line or header
+def normalize_statement(statement):
+    return re.sub(r"\s+", " ", statement).strip()
+
+
+class QueryProfile:
+    def __init__(self):
+        self.statements = []  # (normalized statement, seconds)
+        self.slow = 0
+
+    def record(self, statement, seconds):
+        self.statements.append((normalize_statement(statement), seconds))
+
+    @property
+    def total_seconds(self):
+        return sum(seconds for _, seconds in self.statements)
+
+    # Statements issued at least `threshold` times, most repeated first
+    def repeated(self, threshold):
+        counts = Counter(statement for statement, _ in self.statements)
+        return [(statement, count) for statement, count in counts.most_common() if count >= threshold]
+
+    def headers(self, threshold):
+        repeated = self.repeated(threshold)
+        headers = {
+            SUMMARY_HEADER: f"statements={len(self.statements)}; time_ms={self.total_seconds * 1000:.1f}; "
+                            f"slow={self.slow}; n_plus_one={len(repeated)}"
+        }
+        if repeated:
+            statement, count = repeated[0]
+            # Header values must be latin-1, keep them short and printable
+            headers[REPEATED_HEADER] = f"{count}x {statement[:200]}".encode("latin-1", "replace").decode("latin-1")
+        return headers
+
+
+# Profile of the request currently being served, set by the profiler middleware
+current_profile: ContextVar = ContextVar("current_profile", default=None)
+
+
+# Function to fetch the query plan of a slow statement on the same DBAPI connection
+def explain(conn, statement, parameters):
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        # sqlite rows are (id, parent, notused, detail), only the detail is useful in a log line
+        if conn.dialect.name == "sqlite":
+            return [str(row[-1]) for row in cursor.fetchall()]
+        return [" ".join(str(col) for col in row) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+# Function to attach the profiling listeners to a SQLAlchemy engine
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profiler_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["profiler_started"].pop()
+        profile = current_profile.get()
+        if profile is not None:
+            profile.record(statement, elapsed)
+
+        if elapsed < slow_query_threshold():
+            return
+        if profile is not None:
+            profile.slow += 1
+
+        plan = []
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            try:
+                plan = explain(conn, statement, parameters)
+            except Exception as e:
+                plan = [f"<explain failed: {e}>"]
+        logger.warning("slow query duration_ms=%.1f statement=%s plan=%s",
+                       elapsed * 1000, normalize_statement(statement), " | ".join(plan))
+
+
+# Function to add the profiler middleware that collects and reports statements per request
+def install_middleware(app):
+    @app.middleware("http")
+    async def sql_profiler_middleware(request, call_next):
+        profile = QueryProfile()
+        token = current_profile.set(profile)
+        try:
+            response = await call_next(request)
+        finally:
+            current_profile.reset(token)
+
+        threshold = n_plus_one_threshold()
+        route = route_template(request)
+        for statement, count in profile.repeated(threshold):
+            logger.warning("possible N+1 route=%s count=%d statement=%s", route, count, statement)
+        response.headers.update(profile.headers(threshold))
+        return response
+
+
+# Function to enable profiling on an app and engine when SQL_PROFILE is set
+def install(app, engine):
+    if not is_enabled():
+        return False
+    instrument_engine(engine)
+    install_middleware(app)
+    logger.info("SQL profiler enabled slow_query_ms=%.0f n_plus_one_threshold=%d",
+                slow_query_threshold() * 1000, n_plus_one_threshold())
+    return True
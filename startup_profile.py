@@ -0,0 +1,97 @@
+# startup_profile.py
+# Startup-time report for the API. Imports a module (main by default) in a fresh interpreter with
+# `python -X importtime`, prints the slowest top-level packages and fails when a heavy dependency is
+# imported eagerly or the total import time exceeds the budget (IMPORT_BUDGET_SECONDS, override
+# with STARTUP_IMPORT_BUDGET or --budget). tests/test_startup.py runs the same checks:
+#
+#   python startup_profile.py                      # report for `import main`
+#   python startup_profile.py --budget 1.0         # exit 1 when importing main takes longer than 1s
+#   python startup_profile.py --module crud --top 30
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+# Modules that must never be imported just by importing the app, they are loaded on first use
+LAZY_MODULES = ("pandas", "numpy", "nltk", "sklearn", "boto3", "botocore", "passlib")
+
+# `import main` took about 2.2s with everything eager and about 0.8s lazily
+IMPORT_BUDGET_SECONDS = 1.5
+
+
+def import_budget():
+    return float(os.environ.get("STARTUP_IMPORT_BUDGET", IMPORT_BUDGET_SECONDS))
+
+
+# Function to parse `-X importtime` stderr into (module, self_us, cumulative_us, depth) rows
+def parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def profile_import(module, runs=1, cwd=None):
+    best = None
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, cwd=cwd,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+        rows = parse_importtime(result.stderr)
+        total = sum(self_us for _, self_us, _, _ in rows)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    return best
+
+
+# Function to list the LAZY_MODULES packages an import pulled in
+def eager_modules(rows):
+    return sorted({name.split(".")[0] for name, _, _, _ in rows} & set(LAZY_MODULES))
+
+
+# Function to sum self time per top-level package
+def by_package(rows):
+    totals = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report import time of the app and enforce a budget")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--runs", type=int, default=3, help="Report the fastest of N fresh interpreters")
+    parser.add_argument("--budget", type=float, default=import_budget(),
+                        help="Fail when the import takes longer (seconds), 0 disables")
+    args = parser.parse_args(argv)
+
+    total_us, rows = profile_import(args.module, args.runs)
+
+    print(f"import {args.module}: {total_us / 1e6:.3f}s across {len(rows)} modules")
+    print(f"{'package':<30}{'self ms':>10}{'share':>8}")
+    for package, self_us in by_package(rows)[:args.top]:
+        print(f"{package:<30}{self_us / 1000:>10.1f}{self_us / total_us:>8.1%}")
+
+    failures = []
+    eager = eager_modules(rows)
+    if eager:
+        failures.append(f"heavy modules imported eagerly: {', '.join(eager)}")
+    if args.budget and total_us / 1e6 > args.budget:
+        failures.append(f"import took {total_us / 1e6:.3f}s, budget is {args.budget:.3f}s")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+# conftest.py
+# The app is a set of top-level modules run from the repository root (relative paths such as
+# static/model and travel_app.db), so tests import them from there. Tests that read those paths
+# compute the root themselves
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
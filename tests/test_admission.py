@@ -0,0 +1,113 @@
+# test_admission.py
+# Slot hand-off of the concurrency limiter (queueing, timeouts, cancellation races) and the
+# per-client token buckets, driven directly without the middleware
+import asyncio
+
+import pytest
+
+from admission import ConcurrencyLimiter, Rejected, TokenBucketStore
+
+
+def test_full_queue_rejects():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, max_queue=1, queue_timeout=5.0)
+        assert await limiter.acquire() == 0.0
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert len(limiter.waiters) == 1
+
+        with pytest.raises(Rejected) as rejected:
+            await limiter.acquire()
+        assert rejected.value.reason == "queue_full"
+
+        limiter.release()
+        assert await queued >= 0.0
+        assert limiter.active == 1
+        limiter.release()
+        assert limiter.active == 0 and not limiter.waiters
+
+    asyncio.run(scenario())
+
+
+def test_timed_out_waiter_leaves_the_queue():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, max_queue=2, queue_timeout=0.05)
+        await limiter.acquire()
+        with pytest.raises(Rejected) as rejected:
+            await limiter.acquire()
+        assert rejected.value.reason == "queue_timeout"
+        assert not limiter.waiters
+
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_handed_to_a_gone_waiter_moves_on():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, max_queue=2, queue_timeout=5.0)
+        await limiter.acquire()
+        gone = asyncio.create_task(limiter.acquire())
+        next_in_line = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert len(limiter.waiters) == 2
+
+        # the waiter goes away while the released slot is being handed to it
+        gone.cancel()
+        limiter.release()
+        with pytest.raises(asyncio.CancelledError):
+            await gone
+        assert await asyncio.wait_for(next_in_line, 1.0) >= 0.0
+        assert limiter.active == 1 and not limiter.waiters
+
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_slot_released_from_another_thread():
+    async def scenario():
+        limiter = ConcurrencyLimiter("test", limit=1, max_queue=1, queue_timeout=5.0)
+        await limiter.acquire()
+        queued = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+
+        await asyncio.to_thread(limiter.release)
+        assert await asyncio.wait_for(queued, 1.0) >= 0.0
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_token_bucket_refills_at_rate():
+    buckets = TokenBucketStore(rate=2.0, burst=2)
+    assert buckets.take("client", now=0.0) == 0.0
+    assert buckets.take("client", now=0.0) == 0.0
+    assert buckets.take("client", now=0.0) == pytest.approx(0.5)
+    assert buckets.take("client", now=0.5) == 0.0
+    assert buckets.take("client", now=0.5) == pytest.approx(0.5)
+    # never refills beyond the burst
+    assert [buckets.take("client", now=100.0) for _ in range(3)] == [0.0, 0.0, pytest.approx(0.5)]
+
+
+def test_token_buckets_are_per_client():
+    buckets = TokenBucketStore(rate=1.0, burst=1)
+    assert buckets.take("a", now=0.0) == 0.0
+    assert buckets.take("a", now=0.0) == pytest.approx(1.0)
+    assert buckets.take("b", now=0.0) == 0.0
+
+
+def test_token_bucket_forgets_least_recent_client():
+    buckets = TokenBucketStore(rate=1.0, burst=1, max_clients=1)
+    buckets.take("a", now=0.0)
+    buckets.take("b", now=0.0)
+    assert list(buckets.buckets) == ["b"]
+    assert buckets.take("a", now=0.0) == 0.0
+
+
+def test_zero_rate_disables_limit():
+    buckets = TokenBucketStore(rate=0.0, burst=1)
+    assert all(buckets.take("client", now=0.0) == 0.0 for _ in range(10))
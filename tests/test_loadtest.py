@@ -0,0 +1,15 @@
+# test_loadtest.py
+from loadtest import percentile
+
+
+def test_percentile_is_nearest_rank():
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
+    assert percentile(list(range(1, 10)), 50) == 5
+    assert percentile(list(range(1, 101)), 95) == 95
+    assert percentile(list(range(1, 101)), 99) == 99
+
+
+def test_percentile_bounds():
+    assert percentile([], 50) == 0.0
+    assert percentile([7], 0) == 7
+    assert percentile([1, 2, 3], 100) == 3
@@ -0,0 +1,74 @@
+# test_similar_places.py
+# Places created one after another through create_place must find each other, even when the first
+# place fixed a vocabulary that knows none of their words
+import io
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import crud
+from database import Base
+from models import PlaceSimilarity
+from schemas import PlaceCreate
+from similar_places import SimilarityIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Upload:
+    filename = "place.jpg"
+    file = io.BytesIO(b"")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.chdir(ROOT)  # stopwords are read from static/model
+    monkeypatch.setattr(crud, "upload_to_aws", lambda *args, **kwargs: True)
+    monkeypatch.setattr(crud, "similar_places", SimilarityIndex())
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def create_place(db, title, tags, content):
+    place = crud.create_place(db, PlaceCreate(title=title, tags=tags, content=content, user_id=1,
+                                              user_full_name="Test User", rating_score=0.0), Upload())
+    assert not isinstance(place, dict), place
+    return place.id
+
+
+def similar_ids(db, place_id):
+    return [place["id"] for place in crud.get_similar_places(db, place_id)]
+
+
+def test_near_duplicates_find_each_other(db):
+    hike = create_place(db, "Mountain hike trail", ["hiking"], "A steep trail up the mountain, we love it")
+    waterfall = create_place(db, "Waterfall jungle", ["nature"], "Hidden waterfall deep in the jungle")
+    trek = create_place(db, "Jungle waterfall trek", ["nature"], "A trek through the jungle to the waterfall")
+
+    assert similar_ids(db, waterfall)[0] == trek
+    assert similar_ids(db, trek)[0] == waterfall
+    assert hike not in similar_ids(db, waterfall)
+
+
+def test_unknown_words_do_not_match_on_shared_filler(db):
+    hike = create_place(db, "Mountain hike trail", ["hiking"], "A steep trail up the mountain, we love it")
+    other = create_place(db, "zzz", ["xyz"], "love")
+
+    scores = {place["id"]: place["similarity"] for place in crud.get_similar_places(db, other)}
+    assert scores.get(hike, 0.0) < 0.2
+
+
+def test_lookup_never_writes(db):
+    place = create_place(db, "Waterfall jungle", ["nature"], "Hidden waterfall deep in the jungle")
+    db.query(PlaceSimilarity).delete()
+    db.commit()
+
+    assert crud.get_similar_places(db, place) == []
+    assert db.query(PlaceSimilarity).count() == 0
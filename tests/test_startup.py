@@ -0,0 +1,29 @@
+# test_startup.py
+# Cold start guard: importing main must not pull in the heavy dependencies that are loaded on first
+# use (LAZY_MODULES) and must stay within the import time budget, see startup_profile.py
+import os
+import subprocess
+import sys
+
+from startup_profile import LAZY_MODULES, eager_modules, import_budget, profile_import
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_main_keeps_heavy_modules_lazy():
+    _, rows = profile_import("main", cwd=ROOT)
+    assert rows, "python -X importtime reported nothing for import main"
+    assert eager_modules(rows) == [], f"imported eagerly, keep them lazy: {LAZY_MODULES}"
+
+
+def test_import_main_within_budget():
+    total_us, _ = profile_import("main", runs=3, cwd=ROOT)
+    assert total_us / 1e6 <= import_budget(), (
+        f"import main took {total_us / 1e6:.3f}s, budget {import_budget():.3f}s")
+
+
+def test_import_main_has_no_deprecated_startup_hooks():
+    result = subprocess.run([sys.executable, "-W", "always::DeprecationWarning", "-c", "import main"],
+                            capture_output=True, text=True, cwd=ROOT)
+    assert result.returncode == 0, result.stderr[-2000:]
+    assert "on_event is deprecated" not in result.stderr
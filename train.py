@@ -0,0 +1,250 @@
+# train.py
+# Reproducible training of the sentiment model, the scripted version of
+# notebooks/02.model_building.ipynb. Texts are cleaned with the serving pipeline's clean_text and
+# turned into sparse 0/1 features in parallel, MultinomialNB is fitted, and the model and its
+# vocabulary are published as a new version of the model registry (see model_registry.py), from
+# where it can be shadowed or activated without restarting the API:
+#
+#   python train.py fit artifacts/tripadvisor_extended_1000.csv [--activate | --shadow 0.1]
+#   python train.py update [--base VERSION] [--since 2025-03-01] [--activate | --shadow 0.1]
+#
+# "update" continues a registry version with partial_fit on the comments stored since that version
+# was trained, using their static_rating as a weak label (4-5 positive, 3 neutral, 1-2 negative,
+# unrated comments are skipped). It keeps the base version's vocabulary so the feature columns
+# stay aligned; run "fit" again to pick up new words.
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from model_registry import LEGACY_VERSION, ModelRegistry, load_vocabulary
+from predictionPipeline import clean_text, get_stopwords, label_for, vectorize_sparse
+
+logger = logging.getLogger("travel_app.train")
+
+LABELS = {"negative": 0, "neutral": 1, "positive": 2}
+
+# Texts handed to one parallel job, small enough to balance, large enough to amortize the dispatch
+CHUNK_SIZE = 2000
+
+
+def weak_label(static_rating):
+    if static_rating is None or static_rating <= 0:
+        return None  # 0 is the default of unrated comments
+    if static_rating >= 4:
+        return LABELS["positive"]
+    if static_rating > 2:
+        return LABELS["neutral"]
+    return LABELS["negative"]
+
+
+def _clean_chunk(texts):
+    sw = get_stopwords()
+    return [clean_text(text, sw) for text in texts]
+
+
+# Function to run fn over chunks of items with joblib processes, in order, serially for one chunk
+def parallel_chunks(fn, items, jobs):
+    from joblib import Parallel, delayed
+
+    chunks = [items[start:start + CHUNK_SIZE] for start in range(0, len(items), CHUNK_SIZE)]
+    if jobs == 1 or len(chunks) <= 1:
+        return [fn(chunk) for chunk in chunks]
+    return Parallel(n_jobs=jobs)(delayed(fn)(chunk) for chunk in chunks)
+
+
+def clean_texts(texts, jobs):
+    return [text for chunk in parallel_chunks(_clean_chunk, texts, jobs) for text in chunk]
+
+
+def vectorize(cleaned, tokens, jobs):
+    import scipy.sparse as sp
+
+    blocks = parallel_chunks(lambda chunk: vectorize_sparse(chunk, tokens), cleaned, jobs)
+    if not blocks:
+        return sp.csr_matrix((0, len(tokens)), dtype="float32")
+    return sp.vstack(blocks, format="csr")
+
+
+# Function to keep the tokens seen at least min_count times, in first seen order like the notebook.
+# The list is passed through the serving reader so tokens it would not read back (e.g. "nan") are dropped
+def build_vocabulary(cleaned, min_count):
+    counts = Counter()
+    for sentence in cleaned:
+        counts.update(sentence.split())
+    tokens = [token for token in counts if counts[token] >= min_count]
+    if not tokens:
+        return []
+    return [token for token in load_vocabulary(io.StringIO("\n".join(tokens))) if isinstance(token, str)]
+
+
+def scores(y_true, y_pred):
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+    return {
+        "accuracy": round(accuracy_score(y_true, y_pred), 3),
+        "precision": round(precision_score(y_true, y_pred, average="weighted", zero_division=0), 3),
+        "recall": round(recall_score(y_true, y_pred, average="weighted", zero_division=0), 3),
+        "f1": round(f1_score(y_true, y_pred, average="weighted", zero_division=0), 3),
+    }
+
+
+def class_counts(labels):
+    return {label_for(label): int(count) for label, count in sorted(Counter(labels).items())}
+
+
+def read_dataset(path, text_column, label_column):
+    import pandas as pd
+
+    data = pd.read_csv(path).dropna(subset=[text_column, label_column]).drop_duplicates()
+    labels = data[label_column]
+    if not pd.api.types.is_numeric_dtype(labels):
+        labels = labels.astype(str).str.strip().str.lower().map(LABELS)
+        if labels.isna().any():
+            raise ValueError(f"labels must be 0/1/2 or one of {sorted(LABELS)}")
+    return data[text_column].astype(str).tolist(), labels.astype(int).tolist()
+
+
+# Function to fit a new model and vocabulary from a labeled CSV
+def fit(args, registry):
+    import numpy as np
+    from sklearn.model_selection import train_test_split
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.utils.class_weight import compute_sample_weight
+
+    started = time.perf_counter()
+    texts, labels = read_dataset(args.path, args.text_column, args.label_column)
+    cleaned = clean_texts(texts, args.jobs)
+    tokens = build_vocabulary(cleaned, args.min_count)
+    if not tokens:
+        raise ValueError("empty vocabulary, lower --min-count or add data")
+
+    y = np.asarray(labels)
+    x_train, x_test, y_train, y_test = train_test_split(
+        cleaned, y, test_size=args.test_size, random_state=args.seed,
+        stratify=y if min(Counter(labels).values()) > 1 else None)
+    features_train = vectorize(x_train, tokens, args.jobs)
+    features_test = vectorize(x_test, tokens, args.jobs)
+
+    model = MultinomialNB(alpha=args.alpha)
+    # balanced weights stand in for the notebook's SMOTE oversampling and keep the features sparse
+    model.fit(features_train, y_train, sample_weight=compute_sample_weight("balanced", y_train))
+
+    metrics = {"train": scores(y_train, model.predict(features_train))}
+    if len(y_test):
+        metrics["test"] = scores(y_test, model.predict(features_test))
+    meta = {
+        "kind": "fit",
+        "source": os.path.abspath(args.path),
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "trained_until": datetime.now(timezone.utc).isoformat(),
+        "samples": len(labels),
+        "class_counts": class_counts(labels),
+        "vocabulary_size": len(tokens),
+        "min_count": args.min_count,
+        "seed": args.seed,
+        "metrics": metrics,
+        "duration_seconds": round(time.perf_counter() - started, 3),
+    }
+    return registry.publish(model, tokens, meta), meta
+
+
+# Function to continue a registry version with partial_fit on comments rated since it was trained
+def update(args, registry):
+    import numpy as np
+
+    from database import SessionLocal
+    from models import Comment
+
+    started = time.perf_counter()
+    base_version = args.base or registry.read_state().get("active") or LEGACY_VERSION
+    base = registry.load_version(base_version)
+    since = args.since or registry.read_meta(base_version).get("trained_until")
+
+    db = SessionLocal()
+    try:
+        query = db.query(Comment.comment_text, Comment.static_rating, Comment.commented_at).filter(
+            Comment.static_rating > 0, Comment.comment_text.isnot(None))
+        if since:
+            query = query.filter(Comment.commented_at > datetime.fromisoformat(since).replace(tzinfo=None))
+        rows = query.order_by(Comment.commented_at).all()
+    finally:
+        db.close()
+
+    rows = [row for row in rows if weak_label(row.static_rating) is not None]
+    if not rows:
+        return None, {"kind": "update", "parent": base_version, "since": since, "samples": 0}
+
+    cleaned = clean_texts([row.comment_text for row in rows], args.jobs)
+    features = vectorize(cleaned, base.tokens, args.jobs)
+    y = np.asarray([weak_label(row.static_rating) for row in rows])
+
+    model = base.model
+    before = scores(y, model.predict(features))
+    # weak labels are noisier than the curated training set, so they count for less
+    model.partial_fit(features, y, sample_weight=np.full(len(y), args.weak_label_weight))
+    meta = {
+        "kind": "update",
+        "parent": base_version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "since": since,
+        "trained_until": max(row.commented_at for row in rows).isoformat(),
+        "samples": len(rows),
+        "class_counts": class_counts(y),
+        "vocabulary_size": len(base.tokens),
+        "weak_label_weight": args.weak_label_weight,
+        "metrics": {"weak_labels_before": before, "weak_labels_after": scores(y, model.predict(features))},
+        "duration_seconds": round(time.perf_counter() - started, 3),
+    }
+    return registry.publish(model, base.tokens, meta), meta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train sentiment models into the model registry")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fit_parser = subparsers.add_parser("fit", help="Fit a new model and vocabulary from a labeled CSV")
+    fit_parser.add_argument("path", help="CSV with a text and a label (0/1/2 or negative/neutral/positive) column")
+    fit_parser.add_argument("--text-column", default="tweet")
+    fit_parser.add_argument("--label-column", default="label")
+    fit_parser.add_argument("--min-count", type=int, default=3, help="Minimum occurrences of a vocabulary token")
+    fit_parser.add_argument("--test-size", type=float, default=0.2)
+    fit_parser.add_argument("--alpha", type=float, default=1.0)
+    fit_parser.add_argument("--seed", type=int, default=42)
+
+    update_parser = subparsers.add_parser("update", help="partial_fit a registry version on newly rated comments")
+    update_parser.add_argument("--base", help="Version to continue, the active one by default")
+    update_parser.add_argument("--since", help="ISO date, defaults to when the base version was trained")
+    update_parser.add_argument("--weak-label-weight", type=float, default=0.5)
+
+    for sub in (fit_parser, update_parser):
+        sub.add_argument("--jobs", type=int, default=-1, help="Parallel processes, -1 for one per core")
+        publish = sub.add_mutually_exclusive_group()
+        publish.add_argument("--activate", action="store_true", help="Make the new version active")
+        publish.add_argument("--shadow", type=float, metavar="RATE",
+                             help="Shadow the active model with the new version on this share of texts")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+    registry = ModelRegistry()
+    version, meta = (fit if args.command == "fit" else update)(args, registry)
+    if version is None:
+        print(json.dumps({**meta, "version": None, "message": "no newly rated comments"}))
+        return 0
+
+    # running workers pick registry.json changes up within MODEL_WATCH_SECONDS
+    if args.activate:
+        registry.write_state(active=version)
+    elif args.shadow is not None:
+        registry.write_state(shadow=version, shadow_sample_rate=args.shadow)
+    print(json.dumps({"version": version, **meta}, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())